@@ -0,0 +1,88 @@
+## Measures the round-trip latency of the D-Bus methods of a running Smile
+## (start it first, e.g. `smile --start-hidden`), and compares it with what a
+## script had to do before: start an interpreter and import the emoji database,
+## which was then a generated Python literal (rebuilt here from the binary one, like
+## benchmarks/emoji_database.py does; its bytecode cache is written before measuring).
+##
+## Needs PyGObject and a session bus.
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import statistics
+
+from gi.repository import Gio, GLib
+
+_path = os.path.dirname(os.path.abspath(__file__))
+assets_dir = os.path.abspath(_path + '/../src/assets')
+
+BUS_NAME = 'it.mijorus.smile'
+OBJECT_PATH = '/it/mijorus/smile/actions'
+INTERFACE = 'it.mijorus.smile'
+
+QUERIES = ['smile', 'heart', 'thumbs up', 'cat', 'fire', 'party', 'sunglases', 'flag', 'a', 'rocket']
+ROUNDS = 50
+
+# What a launcher had to do without the service: import the old database and scan the tags
+CHILD_SCRIPT = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from emoji_list import emojis
+[h for h, e in emojis.items() if 'smile' in e['tags']]
+"""
+
+def call(connection: Gio.DBusConnection, method: str, params: GLib.Variant = None) -> GLib.Variant:
+    return connection.call_sync(BUS_NAME, OBJECT_PATH, INTERFACE, method, params, None, Gio.DBusCallFlags.NONE, -1, None)
+
+def print_timings(name: str, timings: list[float]):
+    timings.sort()
+    print(f'{name:<24}{statistics.median(timings):>10.2f}{timings[int(len(timings) * 0.95)]:>10.2f}{timings[-1]:>10.2f}')
+
+def main():
+    connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+
+    try:
+        call(connection, 'GetHistory')
+    except GLib.Error as e:
+        print(f'Smile is not running or does not provide the D-Bus methods: {e.message}')
+        sys.exit(1)
+
+    print(f'{"":<24}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}')
+
+    for name, method, params in [
+        ('Search, 20 results', 'Search', lambda q: GLib.Variant('(su)', (q, 20))),
+        ('Search, all results', 'Search', lambda q: GLib.Variant('(su)', (q, 0))),
+        ('GetHistory', 'GetHistory', lambda q: None),
+    ]:
+        timings = []
+
+        for i in range(ROUNDS):
+            for q in QUERIES:
+                start = time.perf_counter()
+                call(connection, method, params(q))
+                timings.append((time.perf_counter() - start) * 1000)
+
+        print_timings(name, timings)
+
+    sys.path.insert(0, assets_dir)
+    from emoji_list import emojis, emoji_categories, components
+
+    with tempfile.TemporaryDirectory() as legacy_dir:
+        with open(legacy_dir + '/emoji_list.py', 'w') as f:
+            f.write(f'emojis = {dict(emojis)}\nemoji_categories = {emoji_categories}\ncomponents = {components}\n')
+
+        # writes the .pyc, like an installed module would have
+        subprocess.run([sys.executable, '-c', CHILD_SCRIPT, legacy_dir], check=True)
+
+        timings = []
+        for i in range(5):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', CHILD_SCRIPT, legacy_dir], check=True)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    print_timings('new interpreter', timings)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+## Measures how long it takes to construct the emoji buttons of a full grid,
+## comparing the old EmojiButton (one Gio.Settings and one signal handler per
+## button) with the current one, which shares the application settings.
+##
+## Requires PyGObject with GTK 4 and a display (xvfb-run works too).
+## The GSettings schema is compiled from data/ into a temporary directory.
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+import statistics
+import importlib.util
+
+_path = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.abspath(_path + '/..')
+
+schema_dir = tempfile.mkdtemp()
+subprocess.check_call(['glib-compile-schemas', '--targetdir', schema_dir, root_dir + '/data'])
+os.environ['GSETTINGS_SCHEMA_DIR'] = schema_dir
+os.environ.setdefault('GSETTINGS_BACKEND', 'memory')
+
+import gi
+
+gi.require_version('Gtk', '4.0')
+
+from gi.repository import Gtk, Gio  # noqa
+
+# Load src/ as the "smile" package, like the installed app does
+spec = importlib.util.spec_from_file_location('smile', root_dir + '/src/__init__.py', submodule_search_locations=[root_dir + '/src'])
+smile = importlib.util.module_from_spec(spec)
+sys.modules['smile'] = smile
+spec.loader.exec_module(smile)
+
+from smile.assets.emoji_list import emojis  # noqa
+from smile.components.EmojiButton import EmojiButton  # noqa
+from smile.components.EmojiListItem import EmojiListItem  # noqa
+
+
+class LegacyEmojiButton(Gtk.Button):
+    """EmojiButton as it was before the settings were shared"""
+
+    def __init__(self, data: dict, **kwargs):
+        super().__init__(label=data['emoji'], **kwargs)
+
+        self.app_settings = Gio.Settings.new('it.mijorus.smile')
+        self.emoji_data = data
+        self.hexcode = data['hexcode']
+
+        self.update_css_classes()
+        self.app_settings.connect('changed::emoji-size-class', lambda w, val: self.update_css_classes())
+
+    def update_css_classes(self):
+        css = [self.app_settings.get_string('emoji-size-class')]
+
+        if ('skintones' in self.emoji_data) and self.emoji_data['skintones']:
+            css.append('emoji-with-skintones')
+
+        self.set_css_classes(css)
+
+def measure(build: callable, runs: int) -> float:
+    results = []
+    for i in range(runs):
+        start = time.perf_counter()
+        buttons = build()
+        results.append((time.perf_counter() - start) * 1000)
+        del buttons
+
+    return statistics.median(results)
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    data = list(emojis.values())
+    items = [EmojiListItem(e) for e in data]
+
+    legacy = measure(lambda: [LegacyEmojiButton(e) for e in data], runs)
+    current = measure(lambda: [EmojiButton(i) for i in items], runs)
+
+    print(f'{len(data)} buttons, median of {runs} runs')
+    print(f'legacy EmojiButton:  {legacy:8.2f} ms ({legacy * 1000 / len(data):6.1f} us per button)')
+    print(f'current EmojiButton: {current:8.2f} ms ({current * 1000 / len(data):6.1f} us per button)')
+
+if __name__ == '__main__':
+    main()
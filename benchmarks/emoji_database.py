@@ -0,0 +1,83 @@
+## Compares the startup cost of the binary emoji database (src/assets/emoji_list.bin)
+## with the Python literal that was used before (a generated emoji_list.py module).
+##
+## Every measurement runs in a fresh interpreter; "cold" imports have no
+## bytecode cache, "warm" imports reuse the .pyc written by the cold run.
+## RSS is read from /proc, so this only runs on Linux.
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import statistics
+
+_path = os.path.dirname(os.path.abspath(__file__))
+assets_dir = os.path.abspath(_path + '/../src/assets')
+
+# Imports the module, touches every emoji like the picker does, prints the timings
+CHILD_SCRIPT = """
+import sys, json, time
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        return int([l for l in f if l.startswith('VmRSS:')][0].split()[1])
+
+sys.path.insert(0, sys.argv[1])
+rss_before = rss_kb()
+
+start = time.perf_counter()
+from emoji_list import emojis, emoji_categories
+imported = time.perf_counter()
+groups = [e['group'] for e in emojis.values()]
+loaded = time.perf_counter()
+
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'all_emojis_ms': (loaded - start) * 1000,
+    'rss_kb': rss_kb() - rss_before,
+}))
+"""
+
+def measure(module_dir: str, runs: int, cold: bool) -> dict:
+    results = []
+
+    for i in range(runs):
+        if cold:
+            shutil.rmtree(module_dir + '/__pycache__', ignore_errors=True)
+
+        out = subprocess.check_output([sys.executable, '-c', CHILD_SCRIPT, module_dir])
+        results.append(json.loads(out))
+
+    return {k: statistics.median(r[k] for r in results) for k in results[0]}
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    sys.path.insert(0, assets_dir)
+    from emoji_list import emojis, emoji_categories, components
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_dir = tmp + '/legacy'
+        binary_dir = tmp + '/binary'
+        os.mkdir(legacy_dir)
+        os.mkdir(binary_dir)
+
+        with open(legacy_dir + '/emoji_list.py', 'w') as f:
+            f.write(f'emojis = {dict(emojis)}\nemoji_categories = {emoji_categories}\ncomponents = {components}\n')
+
+        shutil.copy(assets_dir + '/emoji_list.py', binary_dir)
+        shutil.copy(assets_dir + '/emoji_list.bin', binary_dir)
+
+        print(f'median of {runs} runs')
+        print(f'{"":<22}{"import ms":>12}{"all emojis ms":>16}{"RSS KiB":>14}')
+
+        for name, module_dir in [('python literal', legacy_dir), ('binary database', binary_dir)]:
+            for cold in [True, False]:
+                r = measure(module_dir, runs, cold)
+                label = f'{name} ({"cold" if cold else "warm"})'
+                print(f'{label:<22}{r["import_ms"]:>12.2f}{r["all_emojis_ms"]:>16.2f}{r["rss_kb"]:>14}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+## Imports the entry point of the app (smile.main, like the launcher does) with
+## `python -X importtime` and checks the startup imports for regressions:
+##
+##   - the modules that are only imported on first use (preferences, shortcuts,
+##     update dialog, popovers, dbus-python...) must not be imported at startup
+##   - with --budget-ms, the cumulative import time of smile.main must stay under it
+##
+## Prints the slowest imports and exits with 1 when a check fails.
+## Needs PyGObject, GTK 4 and libadwaita, like the app.
+##
+## The time from exec to the first frame of the running app is printed by
+## `smile --debug` and recorded in the trace of `smile --profile=FILE`.
+
+import os
+import sys
+import argparse
+import subprocess
+
+_path = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.abspath(_path + '/..')
+
+DEFERRED_MODULES = [
+    'smile.Settings',
+    'smile.ShortcutsWindow',
+    'smile.components.UpdateDialog',
+    'smile.components.CustomTagEntry',
+    'smile.components.SkintoneSelector',
+    'manimpango',
+    'dbus',
+]
+
+# Loads src/ as the "smile" package, like the installed app does, then imports the entry point
+CHILD_SCRIPT = """
+import sys, gettext, importlib.util
+gettext.install('smile')
+
+spec = importlib.util.spec_from_file_location('smile', sys.argv[1] + '/src/__init__.py', submodule_search_locations=[sys.argv[1] + '/src'])
+smile = importlib.util.module_from_spec(spec)
+sys.modules['smile'] = smile
+spec.loader.exec_module(smile)
+
+import smile.main
+"""
+
+def read_import_times(stderr: str) -> dict[str, tuple[int, int]]:
+    """Returns {module: (self us, cumulative us)} from the output of -X importtime"""
+    times = {}
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or ('self [us]' in line):
+            continue
+
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        times[module.strip()] = (int(self_us), int(cumulative_us))
+
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the imports of the smile entry point')
+    parser.add_argument('--budget-ms', type=float, help='fail if importing smile.main takes longer')
+    parser.add_argument('--top', type=int, default=15, help='how many of the slowest imports to print')
+    args = parser.parse_args()
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT, root_dir], capture_output=True, text=True)
+
+    if result.returncode != 0:
+        print(result.stderr)
+        sys.exit(result.returncode)
+
+    times = read_import_times(result.stderr)
+    failed = False
+
+    print(f'{"module":<48}{"self ms":>10}{"cumul. ms":>12}')
+    for module, (self_us, cumulative_us) in sorted(times.items(), key=lambda t: t[1][0], reverse=True)[:args.top]:
+        print(f'{module:<48}{self_us / 1000:>10.1f}{cumulative_us / 1000:>12.1f}')
+
+    total_ms = times['smile.main'][1] / 1000
+    print(f'\nsmile.main imported in {total_ms:.1f} ms, {len(times)} modules')
+
+    for module in DEFERRED_MODULES:
+        if module in times:
+            print(f'FAIL: {module} is imported at startup')
+            failed = True
+
+    if (args.budget_ms is not None) and (total_ms > args.budget_ms):
+        print(f'FAIL: over the budget of {args.budget_ms:.1f} ms')
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
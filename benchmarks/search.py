@@ -0,0 +1,87 @@
+## Replays the query corpus in search_queries.txt one keystroke at a time,
+## like the picker does while the user types, and compares the search index
+## (exact, prefix, substring and typo matching with scores) with the linear
+## scan that was used before, which only matched tags by prefix.
+##
+## Every prefix of every query is searched; "no results" counts the complete
+## queries that found nothing.
+
+import os
+import sys
+import time
+import statistics
+import importlib.util
+
+_path = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.abspath(_path + '/..')
+
+# Load src/ as the "smile" package, like the installed app does
+spec = importlib.util.spec_from_file_location('smile', root_dir + '/src/__init__.py', submodule_search_locations=[root_dir + '/src'])
+smile = importlib.util.module_from_spec(spec)
+sys.modules['smile'] = smile
+spec.loader.exec_module(smile)
+
+from smile.assets.emoji_list import emojis  # noqa
+from smile.lib.search_index import SearchIndex  # noqa
+
+
+def legacy_search(query: str) -> list[str]:
+    """The filter of the old Picker.refresh_emoji_list, with tag_list_contains()"""
+    q = query.lower()
+    results = []
+
+    for hexcode, e in emojis.items():
+        if (query == e['emoji']) or any(t.lower().startswith(q) for t in e['tags'].replace(', ', ',').split(',')):
+            results.append(hexcode)
+
+    return sorted(results, key=lambda h: emojis[h]['order'])
+
+def read_corpus() -> list[str]:
+    with open(_path + '/search_queries.txt') as f:
+        return [l.strip() for l in f if l.strip() and not l.startswith('#')]
+
+def replay(search, queries: list[str]) -> tuple[list[float], int]:
+    timings = []
+    no_results = 0
+
+    for query in queries:
+        for i in range(1, len(query) + 1):
+            start = time.perf_counter()
+            results = search(query[:i])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        if not results:
+            no_results += 1
+
+    return timings, no_results
+
+def main():
+    queries = read_corpus()
+
+    start = time.perf_counter()
+    index = SearchIndex(emojis)
+    print(f'index built in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    # the first query with typos builds the typo index, the app does it in the background
+    start = time.perf_counter()
+    index.search('smlie')
+    index.search('sunglases')
+    print(f'typo index built in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    # frecency ranks of a plausible history
+    history_ranks = {h: i for i, h in enumerate(list(emojis)[:200])}
+
+    print(f'{len(queries)} queries, {sum(len(q) for q in queries)} keystrokes')
+    print(f'{"":<16}{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}{"no results":>12}')
+
+    for name, search in [
+        ('linear scan', legacy_search),
+        ('search index', lambda q: index.search(q, history_ranks=history_ranks)),
+    ]:
+        timings, no_results = replay(search, queries)
+        timings.sort()
+
+        print(f'{name:<16}{statistics.median(timings):>10.2f}{timings[int(len(timings) * 0.95)]:>10.2f}{timings[-1]:>10.2f}{no_results:>12}')
+
+if __name__ == '__main__':
+    main()
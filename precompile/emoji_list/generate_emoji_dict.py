@@ -1,7 +1,10 @@
 import json
-import requests
 import os
-from io import StringIO
+import sys
+
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)) + '/../../src/assets')
+
+from emoji_list import write_emoji_database
 
 problematic = [
     # Skin tones
@@ -74,11 +77,15 @@ def main():
 
     categ = set()
 
-    print('Downloading openmoji.json')
-    openmoji_json = requests.get('https://raw.githubusercontent.com/hfg-gmuend/openmoji/master/data/openmoji.json')
+    # pass --offline to rebuild the database from the openmoji.json that is already here
+    if not '--offline' in sys.argv:
+        import requests
 
-    with open(_path + '/openmoji.json', 'w+') as f:
-        f.write(openmoji_json.text)
+        print('Downloading openmoji.json')
+        openmoji_json = requests.get('https://raw.githubusercontent.com/hfg-gmuend/openmoji/master/data/openmoji.json')
+
+        with open(_path + '/openmoji.json', 'w+') as f:
+            f.write(openmoji_json.text)
 
     emoji_list = json.load(open(_path + '/openmoji.json', 'r'))
 
@@ -146,13 +153,9 @@ def main():
         output[el['hexcode']] = el
         categ.add(el['group'])
 
-    output_dict = StringIO()
-    print(f'emojis = {output}\nemoji_categories = {emoji_categories}\ncomponents = {components}', file=output_dict)
-
-    output_file = open(f"{destdir}/emoji_list.py", 'w+')
-    output_file.write(output_dict.getvalue())
+    write_emoji_database(f"{destdir}/emoji_list.bin", output, emoji_categories, components)
 
-    print(f"Generated {destdir}/emoji_list.py")
+    print(f"Generated {destdir}/emoji_list.bin")
 
 if __name__ == '__main__':
     main()
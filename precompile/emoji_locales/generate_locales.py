@@ -2,12 +2,17 @@
 ## This script was developed with the only purpose of getting the list of locales
 ## from emojibase's CDN.
 ##
-## I'll leave the code here if it will ever need to be used again.
+## The downloaded tags are kept in ./json, the app uses the binary packs
+## written to data/assets/emoji_locales: pass --offline to rebuild them from ./json.
 
 
-import requests
 import json
 import os
+import sys
+
+sys.path.insert(1, os.path.dirname(os.path.abspath(__file__)) + '/../..')
+
+from src.lib.localized_tags import write_locale_pack
 
 def main():
     _path = os.path.dirname(os.path.abspath(__file__))
@@ -85,21 +90,33 @@ def main():
             }
         }
 
+    # lt is not listed in the settings yet, but its pack is shipped anyway
+    locales['lt'] = {}
+
     for locale, locale_obj in locales.items():
-        print('loading: ' + locale)
-        r = requests.get(f'https://cdn.jsdelivr.net/npm/emojibase-data@latest/{locale}/data.json')
-        
-        output = {}
-        for emoji in r.json():
-            if 'tags' in emoji:
-                output[emoji['hexcode']] = {
-                    'tags': emoji['tags'],
-                    'emoji': emoji['emoji'],
-                }
+        json_path = f'{_path}/json/{locale}.json'
+
+        if not '--offline' in sys.argv:
+            import requests
+
+            print('loading: ' + locale)
+            r = requests.get(f'https://cdn.jsdelivr.net/npm/emojibase-data@latest/{locale}/data.json')
+
+            output = {}
+            for emoji in r.json():
+                if 'tags' in emoji:
+                    output[emoji['hexcode']] = {
+                        'tags': emoji['tags'],
+                        'emoji': emoji['emoji'],
+                    }
+
+            with open(json_path, 'w+') as f:
+                # json pretty print
+                f.write(json.dumps(output, indent=4, sort_keys=True, ensure_ascii=False))
 
-        with open(f'{_path}/../../data/assets/emoji_locales/{locale}.json', 'w+') as f:
-            # json pretty print
-            f.write(json.dumps(output, indent=4, sort_keys=True, ensure_ascii=False))
+        with open(json_path, 'r') as f:
+            print('writing pack: ' + locale)
+            write_locale_pack(f'{_path}/../../data/assets/emoji_locales/{locale}.bin', json.load(f))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
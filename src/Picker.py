@@ -19,22 +19,32 @@ import gi
 import os
 import threading
 import subprocess
-from time import time, time_ns, sleep
-from typing import Optional
+from time import sleep, perf_counter
+from typing import Optional, TYPE_CHECKING
+from collections import OrderedDict
 import re
 
-from .ShortcutsWindow import ShortcutsWindow
-from .components.CustomTagEntry import CustomTagEntry
-from .components.SkintoneSelector import SkintoneSelector
-from .components.FlowBoxChild import FlowBoxChild
 from .components.EmojiButton import EmojiButton
-from .lib.custom_tags import get_custom_tags
-from .lib.localized_tags import get_localized_tags
-from .lib.emoji_history import increment_emoji_usage_counter, get_history
-from .utils import tag_list_contains, debounce, idle
+from .components.EmojiListItem import EmojiListItem
+from .lib.emoji_history import get_history, get_history_ranks, get_history_store
+from .lib.custom_tags import connect_custom_tags_changed
+from .lib.search_index import get_search_index
+from .lib.search_worker import SearchWorker
+from .lib.skintones import get_skintone_table
+from .lib.selection_buffer import SelectionBuffer, create_text_content_provider
+from .lib.localized_tags import get_tags_locales
+from .lib import profiler
+from .lib.app_settings import get_app_settings, AppSettings
+from .utils import debounce
 from .lib.DbusService import DbusService, DBUS_SERVICE_INTERFACE, DBUS_SERVICE_PATH
 from .assets.emoji_list import emojis, emoji_categories
 
+# the popovers and the shortcuts window are imported on first use
+if TYPE_CHECKING:
+    from .ShortcutsWindow import ShortcutsWindow
+    from .components.SkintoneSelector import SkintoneSelector
+    from .components.FlowBoxChild import FlowBoxChild
+
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 
@@ -57,21 +67,43 @@ class Picker(Gtk.ApplicationWindow):
         self.add_controller(self.event_controller_keys)
         self.data_dir = Gio.Application.get_default().datadir
 
-        self.settings: Gio.Settings = Gio.Settings.new('it.mijorus.smile')
+        self.settings = get_app_settings()
         self.settings.connect('changed::skintone-modifier', self.update_emoji_skintones)
+        self.settings.connect('changed::emoji-size-class', self.update_emoji_size)
 
         self.EMOJI_GRID_COL_N = 5
+        # about half of the categories, the pages of the others are built again on their next visit
+        self.CATEGORY_PAGE_CACHE_SIZE = 6
+        self.FRAME_BUDGET = 0.004
+        self.RESULTS_FIRST_ROWS = 8
         self.emoji_grid_first_row = []
 
         self.selected_category_index = 0
         self.selected_category = 'smileys-emotion'
         self.query: str = None
-        self.selection: list[str] = []
-        self.selected_buttons: list[EmojiButton] = []
+        self.selection = SelectionBuffer()
         
         self.history = []
         # self.history_size = 0
 
+        self.skintones = get_skintone_table()
+        self.search_index = get_search_index()
+        self.typo_index_source_id = None
+
+        # matching runs in a worker thread, the entry stays responsive even while a locale pack is loaded
+        self.search_worker = SearchWorker()
+        self.activate_on_results = False
+
+        self.settings.connect('changed::use-localized-tags', self.preload_localized_tags)
+        self.settings.connect('changed::tags-locale', self.preload_localized_tags)
+        self.settings.connect('changed::extra-tags-locales', self.preload_localized_tags)
+        self.preload_localized_tags(self.settings, 'tags-locale')
+
+        # changes made by the settings window, the import or another instance
+        self.external_refresh_source_id = None
+        connect_custom_tags_changed(lambda hexcode, tags: self.schedule_external_refresh(bool(self.query)))
+        get_history_store().connect_changed(self.on_history_changed)
+
         self.clipboard = Gdk.Display.get_default().get_clipboard()
 
         # Create the emoji list and category picker
@@ -110,18 +142,54 @@ class Picker(Gtk.ApplicationWindow):
             valign=Gtk.Align.END
         )
 
-        self.emoji_list_widgets: list[FlowBoxChild] = []
-        self.emoji_list = Gtk.FlowBox(
-            valign=Gtk.Align.START,
-            homogeneous=True,
-            css_classes=['emoji_list_box'],
+        # The grid only realizes the visible cells and recycles them while scrolling,
+        # so the list model holds cheap EmojiListItem objects instead of widgets
+        self.emoji_items: dict[str, EmojiListItem] = {}
+        self.bound_emoji_buttons: set[EmojiButton] = set()
+        self.emoji_list_store = Gio.ListStore(item_type=EmojiListItem)
+
+        # Every visited category keeps its sorted list, so going back to it only swaps the model of the grid;
+        # the least recently visited ones are dropped. Only the recents depend on the history,
+        # skintones and sizes are applied when cells are bound
+        self.category_pages: OrderedDict[str, Gio.ListStore] = OrderedDict()
+        self.page_prebuild_source_id = None
+
+        # When the query is extended, the previous results are filtered in place instead of rebuilt
+        self.query_results: list[str] = []
+        # (query, tables) of the last search submitted, (query, tables, results) of the last one shown:
+        # a query that extends the last one only scans the tags of its results for substrings
+        self.submitted_search: Optional[tuple] = None
+        self.last_search: Optional[tuple] = None
+        self.query_matches: Optional[set[str]] = None
+        self.results_population_tick_id = None
+        self.emoji_list_filter = Gtk.CustomFilter.new(lambda item: (self.query_matches is None) or (item.hexcode in self.query_matches))
+        self.emoji_list_model = Gtk.FilterListModel(model=self.emoji_list_store, filter=self.emoji_list_filter)
+
+        self.emoji_selection_model = Gtk.SingleSelection(model=self.emoji_list_model, autoselect=False, can_unselect=True)
+
+        emoji_list_factory = Gtk.SignalListItemFactory()
+        emoji_list_factory.connect('setup', self.on_emoji_list_item_setup)
+        emoji_list_factory.connect('bind', self.on_emoji_list_item_bind)
+        emoji_list_factory.connect('unbind', self.on_emoji_list_item_unbind)
+
+        self.emoji_list = Gtk.GridView(
+            model=self.emoji_selection_model,
+            factory=emoji_list_factory,
+            css_classes=['emoji_list_box', self.settings.get_string('emoji-size-class')],
             margin_top=2,
             margin_bottom=2,
-            selection_mode=Gtk.SelectionMode.SINGLE,
-            max_children_per_line=self.EMOJI_GRID_COL_N,
-            min_children_per_line=self.EMOJI_GRID_COL_N
+            max_columns=self.EMOJI_GRID_COL_N,
+            min_columns=self.EMOJI_GRID_COL_N,
         )
 
+        self.emoji_list.connect('activate', self.handle_emoji_list_activate)
+
+        # the grid moves the focus with the arrows before the window controller sees them,
+        # so Up in the first row is caught on the way down to the cell
+        emoji_list_controller_keys = Gtk.EventControllerKey(propagation_phase=Gtk.PropagationPhase.CAPTURE)
+        emoji_list_controller_keys.connect('key-pressed', self.handle_emoji_list_key_press)
+        self.emoji_list.add_controller(emoji_list_controller_keys)
+
         self.refresh_emoji_list()
         self.category_picker_widgets: list[Gtk.Button] = []
         self.category_picker = self.create_category_picker()
@@ -134,13 +202,12 @@ class Picker(Gtk.ApplicationWindow):
         )
 
         scrolled_emoji_window.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
-        scrolled_container = Adw.Clamp(maximum_size=600)
-
 
-        scrolled_container.set_child(self.emoji_list)
-        scrolled_emoji_window.set_child(scrolled_container)
+        # The grid must be the direct child of the ScrolledWindow, otherwise every cell gets realized
+        scrolled_emoji_window.set_child(self.emoji_list)
+        scrolled_container = Adw.Clamp(maximum_size=600, child=scrolled_emoji_window)
 
-        emoji_list_overlay_container = Gtk.Overlay(child=scrolled_emoji_window)
+        emoji_list_overlay_container = Gtk.Overlay(child=scrolled_container)
 
         emoji_list_overlay_container.add_overlay(self.list_tip_revealer)
         emoji_list_overlay_container.add_overlay(self.select_buffer_revealer)
@@ -174,12 +241,12 @@ class Picker(Gtk.ApplicationWindow):
 
         self.set_titlebar(header_bar)
 
-        self.shortcut_window: ShortcutsWindow = None
+        self.shortcut_window: Optional['ShortcutsWindow'] = None
         self.shift_key_pressed = False
 
         # Display custom tags at the top of the list when searching
         # This variable the status of the sorted status
-        self.skintone_selector: Optional[SkintoneSelector] = None
+        self.skintone_selector: Optional['SkintoneSelector'] = None
 
         self.overlay = Adw.ToastOverlay()
         self.overlay.set_child(self.viewport_box)
@@ -190,17 +257,44 @@ class Picker(Gtk.ApplicationWindow):
         self.set_child(self.overlay)
         self.search_entry.grab_focus()
 
+        self.prebuild_category_pages()
+
     def on_activation(self):
         self.present_with_time(Gdk.CURRENT_TIME)
         self.grab_focus()
 
-        self.emoji_list.unselect_all()
+        self.emoji_selection_model.unselect_all()
 
         if self.settings.get_boolean('iconify-on-esc'):
             self.unminimize()
 
         self.set_focus(self.search_entry)
 
+    def prepare_in_background(self):
+        """Warms up everything the first activation would otherwise pay for, while the window is hidden"""
+        # creates the surface and resolves the styles without showing anything
+        self.realize()
+
+        if self.settings.get_boolean('use-localized-tags'):
+            self.search_index.set_locales(get_tags_locales(self.settings), self.data_dir)
+
+        # decodes every emoji and creates its list item, so category switches don't have to
+        for emoji in emojis.values():
+            self.get_emoji_item(emoji)
+
+    def connect_first_frame(self, callback: callable):
+        """Calls callback(perf_counter()) once the next frame has been painted"""
+        frame_clock = self.get_frame_clock()
+
+        if not frame_clock:
+            return
+
+        def on_after_paint(clock):
+            clock.disconnect(handler_id)
+            callback(perf_counter())
+
+        handler_id = frame_clock.connect('after-paint', on_after_paint)
+
     # Create stuff
     def create_menu_button(self):
         builder = Gtk.Builder()
@@ -230,90 +324,290 @@ class Picker(Gtk.ApplicationWindow):
 
         return box
 
-    def refresh_emoji_list(self):
-        start = time_ns()
+    def on_emoji_list_item_setup(self, factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem):
+        emoji_button = EmojiButton(can_focus=False)
+        emoji_button.connect('clicked', self.handle_emoji_button_click)
 
-        self.emoji_list.remove_all()
-        self.emoji_list_widgets = []
+        gesture = Gtk.GestureSingle(button=Gdk.BUTTON_SECONDARY)
+        gesture.connect('end', lambda e, _: self.show_skintone_selector(e.get_widget().item))
+        emoji_button.add_controller(gesture)
 
-        self.history = get_history()
-        filter_for_recents = self.selected_category == 'recents'
-        tags_locale = self.settings.get_string('tags-locale')
+        gesture_mid_click = Gtk.GestureSingle(button=Gdk.BUTTON_MIDDLE)
+        gesture_mid_click.connect('end', lambda e, _: self.show_custom_tag_entry(e.get_widget().item))
+        emoji_button.add_controller(gesture_mid_click)
+
+        list_item.set_child(emoji_button)
+
+    def on_emoji_list_item_bind(self, factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem):
+        emoji_button: EmojiButton = list_item.get_child()
+        item: EmojiListItem = list_item.get_item()
+
+        emoji_button.bind_item(item, self.get_emoji_label(item))
+        self.bound_emoji_buttons.add(emoji_button)
+
+    def on_emoji_list_item_unbind(self, factory: Gtk.SignalListItemFactory, list_item: Gtk.ListItem):
+        emoji_button: EmojiButton = list_item.get_child()
+
+        emoji_button.unbind_item()
+        self.bound_emoji_buttons.discard(emoji_button)
+
+    def get_emoji_item(self, emoji: dict) -> EmojiListItem:
+        if not emoji['hexcode'] in self.emoji_items:
+            self.emoji_items[emoji['hexcode']] = EmojiListItem(emoji)
+
+        return self.emoji_items[emoji['hexcode']]
+
+    def get_emoji_item_by_hexcode(self, hexcode: str) -> EmojiListItem:
+        """Returns the item of an emoji or of a skintone variant, e.g. when a toned emoji is pasted in the search"""
+        if hexcode in emojis:
+            return self.get_emoji_item(emojis[hexcode])
+
+        if not hexcode in self.emoji_items:
+            base_item = self.get_emoji_item(emojis[self.skintones.get_base(hexcode)])
+            self.emoji_items[hexcode] = EmojiListItem(self.skintones.get_variant_by_hexcode(hexcode), base_skintone_item=base_item)
+
+        return self.emoji_items[hexcode]
+
+    def get_emoji_label(self, item: EmojiListItem) -> str:
+        """Returns the emoji that should be displayed and copied, with the default skintone applied"""
+        modifier_settings = self.settings.get_string('skintone-modifier')
+
+        if modifier_settings:
+            variant = self.skintones.get_variant(item.hexcode, modifier_settings)
+
+            if variant:
+                return variant['emoji']
+
+        return item.emoji_data['emoji']
+
+    def start_search(self):
+        """Searches the current query in the worker thread, the results go to show_search_results()"""
+        use_localised_tags = self.settings.get_boolean('use-localized-tags')
         merge_english_tags = self.settings.get_boolean('merge-english-tags')
-        tags_locale_is_en = tags_locale == 'en'
-
-        use_localised_tags = self.settings.get_boolean('use-localized-tags') if self.query else False
-
-        for key, emoji in emojis.items():
-            is_recent = (emoji['hexcode'] in self.history)
-
-            if self.query:
-                localized_tags = []
-                filter_result = True
-
-                if use_localised_tags and not tags_locale_is_en:
-                    localized_tags = get_localized_tags(tags_locale, emoji['hexcode'], self.data_dir)
-
-                custom_tags = ''
-                if self.query != emoji['emoji']:
-                    custom_tags = get_custom_tags(emoji['hexcode'], cache=True)
-
-                if self.query == emoji['emoji']:
-                    filter_result = True
-                elif custom_tags and tag_list_contains(custom_tags, self.query):
-                    filter_result = True
-                elif use_localised_tags:
-                    if merge_english_tags:
-                        filter_result = tag_list_contains(','.join(localized_tags), self.query) or tag_list_contains(emoji['tags'], self.query)
-                    else:
-                        filter_result = tag_list_contains(','.join(localized_tags), self.query)
-                elif not use_localised_tags:
-                    filter_result = tag_list_contains(emoji['tags'], self.query)
-                else:
-                    filter_result = False
-                
-                if not filter_result: 
-                    continue
+        locales = get_tags_locales(self.settings) if use_localised_tags else None
+        history_ranks = get_history_ranks()
+        query = self.query
+
+        # custom tags are replaced by a new table when they change, the search uses the one captured here
+        custom = self.search_index.custom
+        tables = (use_localised_tags, merge_english_tags, locales, custom)
+        previous_query, previous_results = None, None
+
+        if self.last_search and (self.last_search[1] == tables):
+            previous_query, _, previous_results = self.last_search
+
+        def search() -> list[str]:
+            if locales:
+                self.search_index.set_locales(locales, self.data_dir)
+
+            return self.search_index.search(query, use_localised_tags, merge_english_tags, history_ranks, previous_query, previous_results, custom)
+
+        self.submitted_search = (query, tables)
+        self.search_worker.submit(search, self.show_search_results)
+
+    @profiler.span('refresh_emoji_list', category='picker')
+    def refresh_emoji_list(self, query_results: Optional[list[str]] = None):
+        self.history = get_history()
+        self.query_matches = None
+        self.query_results = []
+        self.cancel_results_population()
+
+        if self.query:
+            self.query_results = query_results or []
+            self.populate_results(self.query_results)
+            model = self.emoji_list_store
+        else:
+            model = self.get_category_page(self.selected_category)
+
+        if self.emoji_list_model.get_model() is not model:
+            self.emoji_list_model.set_model(model)
+
+        self.emoji_selection_model.unselect_all()
+
+    def populate_results(self, results: list[str]):
+        """Shows the first rows of the results right away and appends the others frame after frame
+
+        Every frame gets at most FRAME_BUDGET seconds of appending, so a query that
+        matches most of the emojis doesn't freeze the window.
+        """
+        first_count = self.RESULTS_FIRST_ROWS * self.EMOJI_GRID_COL_N
+        self.emoji_list_store.splice(0, self.emoji_list_store.get_n_items(), [self.get_emoji_item_by_hexcode(h) for h in results[:first_count]])
+
+        pending = iter(results[first_count:])
+
+        def on_tick(widget: Gtk.Widget, frame_clock: Gdk.FrameClock):
+            deadline = perf_counter() + self.FRAME_BUDGET
+            batch = []
+
+            for hexcode in pending:
+                batch.append(self.get_emoji_item_by_hexcode(hexcode))
+
+                if (len(batch) % 32 == 0) and (perf_counter() > deadline):
+                    break
             else:
-                if filter_for_recents:
-                    if not is_recent:
-                        continue
-                elif emoji['group'] != self.selected_category:
-                    continue
+                self.results_population_tick_id = None
+
+            self.emoji_list_store.splice(self.emoji_list_store.get_n_items(), 0, batch)
+            return self.results_population_tick_id is not None
+
+        if len(results) > first_count:
+            self.results_population_tick_id = self.emoji_list.add_tick_callback(on_tick)
+
+    def cancel_results_population(self):
+        if self.results_population_tick_id:
+            self.emoji_list.remove_tick_callback(self.results_population_tick_id)
+            self.results_population_tick_id = None
+
+    def get_category_page(self, category: str) -> Gio.ListStore:
+        """Returns the sorted list of a category, building it on the first visit"""
+        if category in self.category_pages:
+            self.category_pages.move_to_end(category)
+            return self.category_pages[category]
+
+        for _ in self.build_category_page(category):
+            pass
+
+        return self.category_pages[category]
+
+    def build_category_page(self, category: str):
+        """Builds the list of a category a few emojis at a time, yielding between the steps"""
+        results = []
+        for i, e in enumerate(emojis.values()):
+            if category == 'recents':
+                if e['hexcode'] in self.history:
+                    results.append(e)
+            elif e['group'] == category:
+                results.append(e)
+
+            if i % 256 == 255:
+                yield
+
+        items = []
+        for i, e in enumerate(self.sort_emoji_list(results, category)):
+            items.append(self.get_emoji_item(e))
+
+            if i % 64 == 63:
+                yield
+
+        # the page may have been built by a visit in the meantime
+        if category in self.category_pages:
+            return
+
+        page = Gio.ListStore(item_type=EmojiListItem)
+        page.splice(0, 0, items)
+
+        self.category_pages[category] = page
+
+        while len(self.category_pages) > self.CATEGORY_PAGE_CACHE_SIZE:
+            self.category_pages.popitem(last=False)
+
+        profiler.add_counter('category pages', {'warm': self.get_warm_pages_count()[0]}, category='picker')
+
+    def get_warm_pages_count(self) -> tuple[int, int]:
+        """Returns how many categories can be shown without building their list, and how many there are"""
+        return len(self.category_pages), len(emoji_categories)
+
+    def prebuild_category_pages(self):
+        """Builds the pages that were not visited yet while the main loop is idle
+
+        Every slice of work stops after FRAME_BUDGET seconds, so input and redraws
+        (which have a higher priority) never wait for more than that.
+        The recents are left out, they change with every copied emoji.
+        It stops once CATEGORY_PAGE_CACHE_SIZE pages are cached, so it never drops a visited page.
+        """
+        if self.page_prebuild_source_id:
+            return
 
-            emoji_button = EmojiButton(emoji)
-            emoji_button.connect('clicked', self.handle_emoji_button_click)
+        def steps():
+            for category in emoji_categories:
+                if len(self.category_pages) >= self.CATEGORY_PAGE_CACHE_SIZE:
+                    return
 
-            flowbox_child = FlowBoxChild(emoji_button)
+                if (category != 'recents') and (not category in self.category_pages):
+                    yield from self.build_category_page(category)
 
-            gesture = Gtk.GestureSingle(button=Gdk.BUTTON_SECONDARY)
-            gesture.connect('end', lambda e, _: self.show_skintone_selector(e.get_widget()))
-            flowbox_child.add_controller(gesture)
+        pending_steps = steps()
 
-            gesture_mid_click = Gtk.GestureSingle(button=Gdk.BUTTON_MIDDLE)
-            gesture_mid_click.connect('end', lambda e, _: self.show_custom_tag_entry(e.get_widget()))
-            flowbox_child.add_controller(gesture_mid_click)
+        def on_idle():
+            deadline = perf_counter() + self.FRAME_BUDGET
 
-            self.emoji_list.append(flowbox_child)
-            self.emoji_list_widgets.append(flowbox_child)
+            for _ in pending_steps:
+                if perf_counter() > deadline:
+                    return True
+
+            self.page_prebuild_source_id = None
+            return False
+
+        self.page_prebuild_source_id = GLib.idle_add(on_idle, priority=GLib.PRIORITY_LOW)
+
+    def prebuild_typo_index(self):
+        """Builds the typo index of the tags while the main loop is idle, in slices of FRAME_BUDGET seconds like the category pages
 
-        self.emoji_list.set_sort_func(self.sort_emoji_list, None)
-        # print('Emoji list creation took ' + str((time_ns() - start) / 1000000) + 'ms')
+        Otherwise the first search with a typo builds it, in the search worker.
+        """
+        if self.typo_index_source_id:
+            return
+
+        pending_steps = self.search_index.build_steps()
+
+        def on_idle():
+            deadline = perf_counter() + self.FRAME_BUDGET
+
+            for _ in pending_steps:
+                if perf_counter() > deadline:
+                    return True
+
+            self.typo_index_source_id = None
+            return False
+
+        self.typo_index_source_id = GLib.idle_add(on_idle, priority=GLib.PRIORITY_LOW)
+
+    def invalidate_recents_page(self):
+        # the page on screen stays as it is, the next visit builds it again
+        self.category_pages.pop('recents', None)
+
+    @profiler.span('show_search_results', category='picker')
+    def show_search_results(self, results: list[str]):
+        self.search_emoji.debouncer.record_cost(self.search_worker.last_duration)
+        self.last_search = (*self.submitted_search, set(results))
+
+        if not self.query:
+            return
+
+        # the filter can only hide items: a longer query usually keeps a part of the previous
+        # results in the same order, anything else (new emojis, e.g. through typos) needs a new list
+        listed = iter(self.query_results)
+        shows_results = (self.emoji_list_model.get_model() is self.emoji_list_store)
+
+        if shows_results and self.query_results and all(h in listed for h in results):
+            self.query_results = results
+            self.query_matches = set(self.query_results)
+            self.emoji_list_filter.changed(Gtk.FilterChange.MORE_STRICT)
+            self.emoji_selection_model.unselect_all()
+        else:
+            self.refresh_emoji_list(results)
+
+        if self.activate_on_results:
+            self.activate_on_results = False
+            self.handle_search_entry_activate(self.search_entry)
 
     # Handle events
-    def handle_emoji_button_click(self, widget: Gtk.Button):
+    def handle_emoji_button_click(self, widget: EmojiButton):
         widget.get_parent().grab_focus()
 
         if self.settings.get_boolean('mouse-multi-select'):
             if self.shift_key_pressed:
-                self.copy_and_quit(widget)
+                self.copy_and_quit(widget.item, widget.get_label())
             else:
-                self.select_emoji_button(widget)
+                self.select_emoji_button(widget.item, widget.get_label())
         else:
             if not self.shift_key_pressed:
-                self.copy_and_quit(widget)
+                self.copy_and_quit(widget.item, widget.get_label())
             else:
-                self.select_emoji_button(widget)
+                self.select_emoji_button(widget.item, widget.get_label())
+
+    def handle_emoji_list_activate(self, grid_view: Gtk.GridView, position: int):
+        self.copy_and_quit(self.emoji_list_model.get_item(position))
 
     # Handle key-presses
     def handle_window_key_release(self, controller: Gtk.EventController, keyval: int, keycode: int, state: Gdk.ModifierType) -> bool:
@@ -336,27 +630,23 @@ class Picker(Gtk.ApplicationWindow):
         keyval_name = Gdk.keyval_name(keyval)
 
         focused_widget = self.get_focus()
-        focused_button = None
+        focused_button = self.get_focused_emoji_button()
 
-        if isinstance(focused_widget, FlowBoxChild):
-            focused_button = focused_widget.emoji_button
-
-        if self.search_entry is focused_widget.get_parent():
+        if focused_widget and (self.search_entry is focused_widget.get_parent()):
             if (keyval == Gdk.KEY_Down):
                 self.load_first_row()
                 if self.emoji_grid_first_row:
-                    self.emoji_grid_first_row[0].grab_focus()
-                    self.emoji_list.emit('move-cursor', Gtk.MovementStep.BUFFER_ENDS, -1, False, False)
+                    self.emoji_list.scroll_to(0, Gtk.ListScrollFlags.FOCUS, None)
 
                 return True
 
         if alt_key:
             if focused_button and keyval == Gdk.KEY_e:
-                self.show_skintone_selector(focused_widget)
+                self.show_skintone_selector(focused_button.item)
                 return True
 
             elif focused_button and keyval == Gdk.KEY_t:
-                self.show_custom_tag_entry(focused_widget)
+                self.show_custom_tag_entry(focused_button.item)
                 return True
 
             elif keyval in [Gdk.KEY_Left, Gdk.KEY_Right]:
@@ -378,7 +668,7 @@ class Picker(Gtk.ApplicationWindow):
         if shift_key:
             if (keyval == Gdk.KEY_Return):
                 if focused_button:
-                    self.select_emoji_button(focused_button)
+                    self.select_emoji_button(focused_button.item, focused_button.get_label())
                     return True
 
             if (keyval == Gdk.KEY_BackSpace):
@@ -389,6 +679,8 @@ class Picker(Gtk.ApplicationWindow):
 
         elif ctrl_key:
             if keyval == Gdk.KEY_question:
+                from .ShortcutsWindow import ShortcutsWindow
+
                 shortcut_window = ShortcutsWindow()
                 shortcut_window.open()
 
@@ -412,15 +704,13 @@ class Picker(Gtk.ApplicationWindow):
             if focused_button:
                 # Focus is on an emoji button
                 if (keyval == Gdk.KEY_Return):
-                    self.copy_and_quit(focused_button)
+                    self.copy_and_quit(focused_button.item, focused_button.get_label())
                     return True
                 elif (not is_modifier) and (len(keyval_name) == 1) and re.match(r'\S', keyval_name):
                     self.search_entry.insert_text(keyval_name, -1)
                     self.search_entry.set_position(-1)
                     self.search_entry.grab_focus()
                     return True
-                elif (keyval == Gdk.KEY_Up) and (focused_widget in self.emoji_grid_first_row):
-                    self.search_entry.grab_focus()
 
             elif isinstance(focused_widget, Gtk.Button) and hasattr(focused_widget, 'category'):
                 # Focus is on a category button
@@ -432,30 +722,36 @@ class Picker(Gtk.ApplicationWindow):
                     if (keyval == Gdk.KEY_Up):
                         self.set_active_category(focused_widget.category)
 
-                        for f in self.emoji_list_widgets:
-                            if self.selected_category == 'recents':
-                                if f.emoji_button.hexcode in get_history():
-                                    f.emoji_button.grab_focus()
-                                    break
-                            else:
-                                if f.emoji_button.emoji_data['group'] == self.selected_category:
-                                    f.emoji_button.grab_focus()
-                                    break
+                        if self.emoji_list_model.get_n_items():
+                            self.emoji_list.scroll_to(0, Gtk.ListScrollFlags.FOCUS, None)
 
                     return True
 
         return False
 
+    def handle_emoji_list_key_press(self, controller: Gtk.EventController, keyval: int, keycode: int, state: Gdk.ModifierType) -> bool:
+        modifiers = state & (Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK | Gdk.ModifierType.ALT_MASK)
+
+        if (keyval == Gdk.KEY_Up) and (not modifiers):
+            focused_button = self.get_focused_emoji_button()
+            self.load_first_row()
+
+            if focused_button and (focused_button.item in self.emoji_grid_first_row):
+                self.search_entry.grab_focus()
+                return True
+
+        return False
+
     def handle_skintone_selector_key_press(self, controller: Gtk.EventController, keyval: int, keycode: int, state: Gdk.ModifierType) -> bool:
         shift_key = bool(state & Gdk.ModifierType.SHIFT_MASK)
-        focused_widget: FlowBoxChild = self.skintone_selector.get_focus()
+        focused_widget: 'FlowBoxChild' = self.skintone_selector.get_focus()
 
         self.shift_key_pressed = (keyval == Gdk.KEY_Shift_L) or (keyval == Gdk.KEY_Shift_R)
 
         if shift_key:
             self.shift_key_pressed = True
             if (keyval == Gdk.KEY_Return):
-                self.select_emoji_button(focused_widget.emoji_button)
+                self.select_emoji_button(focused_widget.emoji_button.item, focused_widget.emoji_button.get_label())
                 return True
 
             elif (keyval == Gdk.KEY_BackSpace):
@@ -465,22 +761,29 @@ class Picker(Gtk.ApplicationWindow):
         else:
             if (keyval == Gdk.KEY_Return):
                 self.skintone_selector.request_close()
-                self.copy_and_quit(focused_widget.emoji_button)
+                self.copy_and_quit(focused_widget.emoji_button.item, focused_widget.emoji_button.get_label())
                 return True
 
         return False
 
     def handle_search_entry_activate(self, entry: Gtk.Entry):
-        if self.query:
+        # the last letters may still be waiting for the debouncer, their search has to start now
+        self.search_emoji.debouncer.flush()
+
+        if self.query and self.search_worker.is_pending():
+            # Enter was pressed before the results of the last letters came back
+            self.activate_on_results = True
+
+        elif self.query:
             self.load_first_row()
             if self.emoji_grid_first_row:
-                self.copy_and_quit(self.emoji_grid_first_row[0].emoji_button)
+                self.copy_and_quit(self.emoji_grid_first_row[0])
 
     def send_paste_signal(self):
         if not self.settings.get_boolean('auto-paste') or not self.last_copied_text:
             return
 
-        if DbusService.dbus_connection:
+        if DbusService.dbus_connection and (DbusService.extension_status != 'unavailable'):
             DbusService.dbus_connection.emit_signal(None, DBUS_SERVICE_PATH, DBUS_SERVICE_INTERFACE, 'CopiedEmoji', GLib.Variant('(s)', (self.last_copied_text,)))
         elif os.getenv('XDG_SESSION_TYPE') != 'wayland':
             subprocess.check_output(['xdotool', 'key', 'ctrl+v'])
@@ -490,21 +793,13 @@ class Picker(Gtk.ApplicationWindow):
         self.select_buffer_label.set_text('')
         self.select_buffer_revealer.set_reveal_child(False)
         self.query = None
-        self.selection = []
+        self.selection.clear()
         self.set_empty_recent_tip(None)
 
-        for button in self.selected_buttons:
-            button.get_parent().deselect()
-
-        for button in self.emoji_list_widgets:
-            button.deselect()
-
-        self.selected_buttons = []
-
         if self.settings.get_boolean('iconify-on-esc'):
             self.minimize()
             if paste_on_exit: self.send_paste_signal()
-        elif not self.settings.get_boolean('load-hidden-on-startup'):
+        elif not Gio.Application.get_default().runs_in_background():
             # async to avoid blocking the main thread
             def close_patch():
                 GLib.idle_add(lambda: self.hide())
@@ -519,36 +814,57 @@ class Picker(Gtk.ApplicationWindow):
             if paste_on_exit: self.send_paste_signal()
 
     # # # # # #
-    def show_skintone_selector(self, focused_widget: FlowBoxChild):
-        self.emoji_list.select_child(focused_widget)
+    def show_skintone_selector(self, item: EmojiListItem):
+        from .components.SkintoneSelector import SkintoneSelector
 
-        if not SkintoneSelector.check_skintone(focused_widget):
+        self.select_emoji_list_item(item)
+
+        if not SkintoneSelector.check_skintone(item):
             self.overlay.add_toast(
                 Adw.Toast(title="No skintones available", timeout=1)
             )
         else:
             self.skintone_selector = SkintoneSelector(
-                focused_widget,
+                item,
                 parent=self,
                 click_handler=self.handle_emoji_button_click,
                 keypress_handler=self.handle_skintone_selector_key_press,
-                emoji_active_selection=self.selected_buttons
+                emoji_active_selection=self.selection.items
             )
 
-    def show_custom_tag_entry(self, focused_widget: FlowBoxChild):
-        CustomTagEntry(focused_widget, self)
+            self.skintone_selector.connect('destroy', lambda w: setattr(self, 'skintone_selector', None))
+
+    def show_custom_tag_entry(self, item: EmojiListItem):
+        from .components.CustomTagEntry import CustomTagEntry
+
+        # custom tags belong to the base emoji, a variant found by pasting it edits those
+        CustomTagEntry(item.base_skintone_item or item, self)
+
+    def get_focused_emoji_button(self) -> Optional[EmojiButton]:
+        # the grid focuses its own cell widget, the button is its child
+        focused_widget = self.get_focus()
+
+        if isinstance(focused_widget, EmojiButton):
+            return focused_widget
+
+        if focused_widget and isinstance(focused_widget.get_first_child(), EmojiButton):
+            return focused_widget.get_first_child()
+
+        return None
+
+    def select_emoji_list_item(self, item: EmojiListItem):
+        for position in range(self.emoji_list_model.get_n_items()):
+            if self.emoji_list_model.get_item(position) is item:
+                self.emoji_selection_model.select_item(position, True)
+                break
 
     def set_empty_recent_tip(self, enabled: bool):
         self.list_tip_revealer.set_visible(enabled)
         self.list_tip_revealer.set_reveal_child(enabled)
 
-    def update_selection_content(self, selection: str = None):
-        if selection:
-            self.select_buffer_label.set_label(''.join(selection))
-        else:
-            self.select_buffer_label.set_label('')
-
-        self.select_buffer_revealer.set_reveal_child(True if selection else False)
+    def update_selection_content(self):
+        self.select_buffer_label.set_label(self.selection.get_text())
+        self.select_buffer_revealer.set_reveal_child(bool(self.selection))
 
     def set_active_category(self, category: str):
         for b in self.category_picker_widgets:
@@ -557,57 +873,38 @@ class Picker(Gtk.ApplicationWindow):
             else:
                 b.get_style_context().add_class('selected')
 
-    def select_emoji_button(self, button: EmojiButton):
-        self.selected_buttons.append(button)
-        self.selection.append(button.get_label())
-        self.emoji_list.select_child(button.get_parent())
-
-        increment_emoji_usage_counter(button)
+    def select_emoji_button(self, item: EmojiListItem, label: Optional[str] = None):
+        # the history is updated once, when the selection is copied
+        self.selection.append(item, label or self.get_emoji_label(item))
+        self.select_emoji_list_item(item)
 
-        button.get_parent().set_as_selected()
-        button.get_parent().set_as_active()
+        if self.skintone_selector:
+            self.skintone_selector.update_selected_children(self.selection.items)
 
-        if button.base_skintone_widget:
-            button.base_skintone_widget.set_as_selected()
-
-        self.update_selection_content(self.selection)
+        self.update_selection_content()
 
     def deselect_emoji_button(self):
         if not self.selection:
             return
 
-        last_button = self.selected_buttons[-1]
-
         self.selection.pop()
-        self.selected_buttons.pop()
 
-        if not last_button.get_label() in self.selection:
-            last_button.get_parent().deselect()
+        if self.skintone_selector:
+            self.skintone_selector.update_selected_children(self.selection.items)
 
-        if last_button.base_skintone_widget:
-            base_skintone_widget_is_selected = False
-
-            for sb in self.selected_buttons:
-                if sb.base_skintone_widget is last_button.base_skintone_widget:
-                    base_skintone_widget_is_selected = True
-                    break
-
-            if not base_skintone_widget_is_selected:
-                last_button.base_skintone_widget.deselect()
-
-        self.update_selection_content(self.selection)
+        self.update_selection_content()
 
     def load_first_row(self):
         self.emoji_grid_first_row = []
-        for widget in self.emoji_list_widgets:
-            if (len(self.emoji_grid_first_row) < self.EMOJI_GRID_COL_N) and widget.props.visible:
-                self.emoji_grid_first_row.append(widget)
+        for i in range(min(self.EMOJI_GRID_COL_N, self.emoji_list_model.get_n_items())):
+            self.emoji_grid_first_row.append(self.emoji_list_model.get_item(i))
 
     def filter_for_category(self, widget: Gtk.Button):
         self.set_active_category(widget.category)
         widget.grab_focus()
 
         self.query = None
+        self.search_worker.cancel()
         self.selected_category = widget.category
         self.selected_category_index = widget.index
 
@@ -617,15 +914,11 @@ class Picker(Gtk.ApplicationWindow):
         self.refresh_emoji_list()
         self.load_first_row()
 
-    def copy_and_quit(self, button: Gtk.Button = None):
-        text = ''
-        if button:
-            text = button.get_label()
-            increment_emoji_usage_counter(button)
+    def copy_and_quit(self, item: EmojiListItem = None, label: Optional[str] = None):
+        # the history store calls on_history_changed(), that drops the cached recents
+        copied_text = self.selection.commit(item, (label or self.get_emoji_label(item)) if item else None)
 
-        copied_text = ''.join([*self.selection, text])
-        contx = Gdk.ContentProvider.new_for_value(copied_text)
-        self.clipboard.set_content(contx)
+        self.clipboard.set_content(create_text_content_provider(copied_text))
 
         self.last_copied_text = copied_text
 
@@ -639,45 +932,63 @@ class Picker(Gtk.ApplicationWindow):
 
         self.default_hiding_action()
 
-    @debounce(0.2)
-    @idle
+    # submitting a search is cheap, the wait adapts to how long the worker takes to run it
+    @debounce(0.05, leading=True, adaptive=True, max_wait=0.2, measure_cost=False)
+    @profiler.span('search_emoji', category='picker')
     def search_emoji(self, search_entry: str):
-        start = time_ns()
-
         self.search_entry.grab_focus()
         query = search_entry.get_text().strip()
 
+        previous_query = self.query
         self.query = query if query else None
 
-        self.refresh_emoji_list()
-        self.emoji_list.invalidate_sort()
-        # print('Search took ' + str((time_ns() - start) / 1000000) + 'ms')
+        if self.query and (self.query == previous_query):
+            return
+        elif self.query:
+            self.start_search()
+        else:
+            self.search_worker.cancel()
+            self.activate_on_results = False
+            self.refresh_emoji_list()
 
-    def sort_emoji_list(self, child1: Gtk.FlowBoxChild, child2: Gtk.FlowBoxChild, user_data):
-        child1 = child1.get_child()
-        child2 = child2.get_child()
+    def sort_emoji_list(self, results: list[dict], category: str) -> list[dict]:
+        if category == 'recents':
+            # ranks are computed once per history change, not for every comparison
+            ranks = get_history_ranks()
+            return sorted(results, key=lambda e: ranks.get(e['hexcode'], len(ranks)))
 
-        if (self.selected_category == 'recents'):
-            h1 = self.history[child1.hexcode] if child1.hexcode in self.history else None
-            h2 = self.history[child2.hexcode] if child2.hexcode in self.history else None
-            return ((h2['lastUsage'] if h2 else 0) - (h1['lastUsage'] if h1 else 0))
+        else:
+            return sorted(results, key=lambda e: e['order'])
 
-        elif self.query:
-            return -1 if get_custom_tags(child1.hexcode, True) else 1
+    def on_history_changed(self):
+        self.invalidate_recents_page()
+        self.schedule_external_refresh((self.selected_category == 'recents') and not self.query)
 
+    def schedule_external_refresh(self, affects_list: bool):
+        # an import changes many emojis at once, the list is refreshed only once
+        if affects_list and (self.external_refresh_source_id is None):
+            self.external_refresh_source_id = GLib.idle_add(self.on_external_refresh)
+
+    def on_external_refresh(self):
+        self.external_refresh_source_id = None
+
+        if self.query:
+            self.start_search()
         else:
-            return (child1.emoji_data['order'] - child2.emoji_data['order'])
+            self.refresh_emoji_list()
 
-    def update_emoji_skintones(self, settings: Gio.Settings, key):
-        modifier_settings = self.settings.get_string('skintone-modifier')
-        for child in self.emoji_list_widgets:
-            emoji_button = child.emoji_button
-
-            if 'skintones' in emoji_button.emoji_data:
-                if len(modifier_settings):
-                    for tone in emoji_button.emoji_data['skintones']:
-                        if f'-{modifier_settings}' in tone['hexcode']:
-                            emoji_button.set_label(tone['emoji'])
-                            break
-                else:
-                    emoji_button.set_label(emoji_button.emoji_data['emoji'])
+        return False
+
+    def preload_localized_tags(self, settings: AppSettings, key):
+        # the locale pack is mapped in a worker thread, the first search finds it ready
+        if settings.get_boolean('use-localized-tags'):
+            self.search_index.preload_locales(get_tags_locales(settings), self.data_dir)
+
+    def update_emoji_size(self, settings: AppSettings, key):
+        # a single class swap on the grid, the buttons inherit the font size
+        self.emoji_list.set_css_classes(['emoji_list_box', settings.get_string(key)])
+
+    def update_emoji_skintones(self, settings: AppSettings, key):
+        # only the bound cells exist, the others will pick up the new label when scrolled into view
+        for emoji_button in self.bound_emoji_buttons:
+            emoji_button.set_label(self.get_emoji_label(emoji_button.item))
@@ -3,11 +3,11 @@ import gi
 import json
 from datetime import datetime
 
-from dbus import Array as DBusArray
 from .assets.emoji_list import emojis
-from .lib.user_config import read_json_config, save_json_config
-from .lib.custom_tags import set_custom_tags, get_all_custom_tags, delete_custom_tags
-from .lib.localized_tags import get_countries_list
+from .lib.user_config import read_json_config
+from .lib.custom_tags import set_custom_tags, get_all_custom_tags, delete_custom_tags, import_custom_tags
+from .lib.localized_tags import get_countries_list, get_locale_pack_memory_usage, LOCALE_PACK_CACHE_SIZE
+from .lib.app_settings import get_app_settings
 from .utils import portal
 from .components.UrlRow import UriRow
 from .lib.DbusService import DbusService, GNOME_EXTENSION_LINK
@@ -20,7 +20,7 @@ class Settings(Adw.PreferencesWindow):
     def __init__(self, application_id: str, **kwargs):
         super().__init__(**kwargs)
         self.application_id = application_id
-        self.settings = Gio.Settings.new('it.mijorus.smile')
+        self.settings = get_app_settings()
 
         if self.settings.get_string('tags-locale') == 'en':
             self.settings.set_string('tags-locale', 'da')
@@ -72,6 +72,7 @@ class Settings(Adw.PreferencesWindow):
         customization_group = Adw.PreferencesGroup(title=_('Customization'))
         customization_group.add(self.create_modifiers_combo_boxes())
         customization_group.add(self.create_emoji_sizes_combo_boxes())
+        customization_group.add(self.create_history_size_settings_entry())
 
         self.localized_tags_group = Adw.PreferencesGroup(title=_('Localized tags'))
         self.localized_tags_group.add(
@@ -84,7 +85,8 @@ class Settings(Adw.PreferencesWindow):
                 'merge-english-tags',
                 _('Use both localized tags and English ones at the same time')
             ),
-            self.create_tags_locale_combo_boxes()
+            self.create_tags_locale_combo_boxes(),
+            self.create_extra_tags_locales_row()
         ]
 
         [self.localized_tags_group.add(item) for item in self.localized_tags_group_items]
@@ -118,7 +120,7 @@ class Settings(Adw.PreferencesWindow):
         self.on_use_localized_tags_changed(self.settings, 'use-localized-tags')
 
         self.custom_tags_entries: list[Gtk.Entry] = []
-        self.settings.connect('changed', self.on_settings_changes)
+        self.settings_handler_id = self.settings.connect('changed', self.on_settings_changes)
         self.connect('close-request', self.on_window_close)
 
     def get_autopaste_status(self):
@@ -153,7 +155,7 @@ class Settings(Adw.PreferencesWindow):
 
         rows = []
         for hexcode, config in custom_tags.items():
-            if not 'tags' in config or not config['tags']:
+            if not isinstance(config, dict) or not config.get('tags'):
                 continue
 
             listbox_row = Gtk.ListBoxRow(selectable=False)
@@ -243,6 +245,16 @@ class Settings(Adw.PreferencesWindow):
         row.add_suffix(emoji_size_combo)
         return row
 
+    def create_history_size_settings_entry(self) -> Adw.ActionRow:
+        row = Adw.ActionRow(title=_('Recent emojis'), subtitle=_('How many emojis are kept in the history'))
+
+        history_size_spin = Gtk.SpinButton.new_with_range(10, 1000, 10)
+        history_size_spin.set_valign(Gtk.Align.CENTER)
+        self.settings.bind('history-size', history_size_spin, 'value', Gio.SettingsBindFlags.DEFAULT)
+
+        row.add_suffix(history_size_spin)
+        return row
+
     def create_tags_locale_combo_boxes(self) -> Adw.ActionRow:
         row = Adw.ActionRow(title=_('Localized tags'))
         locales_combo = Gtk.ComboBoxText(valign=Gtk.Align.CENTER)
@@ -260,6 +272,67 @@ class Settings(Adw.PreferencesWindow):
         row.add_suffix(locales_combo)
         return row
 
+    def create_extra_tags_locales_row(self) -> Adw.ExpanderRow:
+        row = Adw.ExpanderRow(title=_('More languages'), subtitle=_('Search the tags of these languages at the same time'))
+        extra_locales = self.settings.get_strv('extra-tags-locales')
+
+        # {lang: (row, check button)}
+        self.extra_tags_locales_rows = {}
+
+        for k, v in get_countries_list().items():
+            check = Gtk.CheckButton(valign=Gtk.Align.CENTER, active=(k in extra_locales))
+            check.connect('toggled', self.on_extra_tags_locale_toggled, k)
+
+            locale_row = Adw.ActionRow(title=v['flag'] + ' ' + v['language'], activatable_widget=check)
+            locale_row.add_prefix(check)
+
+            row.add_row(locale_row)
+            self.extra_tags_locales_rows[k] = (locale_row, check)
+
+        row.connect('notify::expanded', lambda w, p: self.update_extra_tags_locales_rows())
+        self.update_extra_tags_locales_rows()
+        return row
+
+    def update_extra_tags_locales_rows(self):
+        main_locale = self.settings.get_string('tags-locale')
+        extra_locales = self.settings.get_strv('extra-tags-locales')
+        datadir = Gio.Application.get_default().datadir
+
+        # the main language and the extra ones must fit in the cache of locale packs
+        can_add = len([l for l in extra_locales if l != main_locale]) < (LOCALE_PACK_CACHE_SIZE - 1)
+
+        for lang, (row, check) in self.extra_tags_locales_rows.items():
+            loaded, size = get_locale_pack_memory_usage(lang, datadir)
+            size = GLib.format_size(size)
+
+            if lang == main_locale:
+                row.set_subtitle(_('Main language, using {size}').format(size=size) if loaded else _('Main language'))
+            elif loaded:
+                row.set_subtitle(_('Loaded, using {size}').format(size=size))
+            else:
+                row.set_subtitle(_('About {size} when enabled').format(size=size))
+
+            check.set_sensitive((lang != main_locale) and (check.get_active() or can_add))
+
+    def on_extra_tags_locale_toggled(self, check: Gtk.CheckButton, lang: str):
+        extra_locales = self.settings.get_strv('extra-tags-locales')
+
+        if check.get_active() and (not lang in extra_locales):
+            extra_locales.append(lang)
+        elif (not check.get_active()) and (lang in extra_locales):
+            extra_locales.remove(lang)
+
+        self.settings.set_strv('extra-tags-locales', extra_locales)
+
+    def on_extra_tags_locales_changed(self, settings, key: str):
+        self.update_extra_tags_locales_rows()
+
+        # the picker loads the new packs in the background, the sizes are updated when they are ready
+        GLib.timeout_add(300, lambda: self.update_extra_tags_locales_rows() and False)
+
+    def on_tags_locale_changed(self, settings, key: str):
+        self.on_extra_tags_locales_changed(settings, key)
+
     def on_settings_changes(self, settings, key: str):
         callback = getattr(self, f"on_{key.replace('-', '_')}_changed", None)
 
@@ -267,6 +340,8 @@ class Settings(Adw.PreferencesWindow):
             callback(settings, key)
 
     def on_window_close(self, widget: Gtk.Window):
+        self.settings.disconnect(self.settings_handler_id)
+
         for row in self.custom_tags_rows:
             if hasattr(row, 'hexcode'):
                 set_custom_tags(row.hexcode, row.__entry.get_text())
@@ -281,6 +356,8 @@ class Settings(Adw.PreferencesWindow):
         if old_autostart_file.query_exists():
             old_autostart_file.delete()
 
+        from dbus import Array as DBusArray
+
         inter = portal("org.freedesktop.portal.Background")
         res = inter.RequestBackground('', {'reason': 'Smile autostart', 'autostart': value, 'background': value, 'commandline': DBusArray(['smile', '--start-hidden'])})
 
@@ -314,7 +391,7 @@ class Settings(Adw.PreferencesWindow):
 
                 if isinstance(restore, dict) and any(em in emojis.keys() for em in restore.keys()):
                     print('Restoring from backup...')
-                    save_json_config(restore, 'custom_tags')
+                    import_custom_tags(restore)
 
                     [self.custom_tags_list_box.remove(r) for r in self.custom_tags_rows]
 
@@ -5,6 +5,7 @@ import os
 import csv
 import re
 from .assets.emoji_list import emojis
+from .lib.app_settings import get_app_settings
 
 gi.require_version('Gtk', '4.0')
 
@@ -17,7 +18,7 @@ class ShortcutsWindow():
         self.shortcut_window = builder.get_object('shortcuts')
         self.shortcut_window.set_default_size(600, 400)
 
-        settings = Gio.Settings.new('it.mijorus.smile')
+        settings = get_app_settings()
 
         add_em_to_selection_label = _('Add an emoji to selection')
         copy_quit_label = _('Copy the selected emoji and hide the window')
@@ -1,7 +1,9 @@
 import gi
 from ..lib.custom_tags import set_custom_tags, get_custom_tags
-from ..lib.localized_tags import get_localized_tags, get_countries_list
+from ..lib.localized_tags import get_localized_tags, get_countries_list, get_tags_locales
 from .CustomPopover import CustomPopover
+from .EmojiListItem import EmojiListItem
+from ..lib.app_settings import get_app_settings
 
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
@@ -10,43 +12,49 @@ from gi.repository import Gtk, Gio, Gdk, GLib, Adw  # noqa
 
 
 class CustomTagEntry(CustomPopover):
-    def __init__(self, flowbox_child: Gtk.FlowBoxChild, parent: Gtk.Window):
+    def __init__(self, item: EmojiListItem, parent: Gtk.Window):
         super().__init__(parent=parent)
 
-        self.emoji_buttom = flowbox_child.emoji_button
-        self.flowbox_child = flowbox_child
+        self.item = item
 
         popover_content = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, name='custom_tag_entry')
-        self.relative_widget_hexcode = self.emoji_buttom.emoji_data['hexcode']
+        self.relative_widget_hexcode = self.item.hexcode
 
         max_tags_lengh = 30
         
         from ..assets.emoji_list import emojis
         default_tags = emojis[self.relative_widget_hexcode]['tags']
 
-        localized_tags = []
+        # {language: tags}, for every language that is searched
+        localized_tags = {}
 
-        settings: Gio.Settings = Gio.Settings.new('it.mijorus.smile')
+        settings = get_app_settings()
         if settings.get_boolean('use-localized-tags'):
-            tl = get_localized_tags(settings.get_string('tags-locale'), self.relative_widget_hexcode, Gio.Application.get_default().datadir)
-            localized_tags = ', '.join(tl)
+            for lang in get_tags_locales(settings):
+                if not lang in get_countries_list():
+                    continue
+
+                tl = ', '.join(get_localized_tags(lang, self.relative_widget_hexcode, Gio.Application.get_default().datadir))
+
+                if len(tl) > max_tags_lengh:
+                    tl = tl[0:max_tags_lengh] + '...'
+
+                if tl:
+                    localized_tags[get_countries_list()[lang]['language']] = tl
 
         if len(default_tags) > max_tags_lengh:
             default_tags = default_tags[0:max_tags_lengh] + '...'
 
-        if len(localized_tags) > max_tags_lengh:
-            localized_tags = localized_tags[0:max_tags_lengh] + '...'
-
         popover_content.append(
             Gtk.Label(
-                label=f'<b>{self.emoji_buttom.emoji_data["emoji"]} Edit custom tags</b>',
+                label=f'<b>{self.item.emoji_data["emoji"]} Edit custom tags</b>',
                 use_markup=True,
                 margin_bottom=10,
                 css_classes=['heading']
             )
         )
 
-        self.entry = Gtk.Entry(text=get_custom_tags(self.emoji_buttom.hexcode))
+        self.entry = Gtk.Entry(text=get_custom_tags(self.item.hexcode))
         self.entry.set_placeholder_text("List of custom tags, separated  by comma")
         popover_content.append(self.entry)
 
@@ -54,8 +62,8 @@ class CustomTagEntry(CustomPopover):
         self.handle_close = self.on_close
 
         label_text = f"<small><b>Default tags</b>: {default_tags}</small>"
-        if len(localized_tags) > 0:
-            label_text += f"\n<small><b>{get_countries_list()[settings.get_string('tags-locale')]['language']} tags</b>: {localized_tags}</small>"
+        for language, tl in localized_tags.items():
+            label_text += f"\n<small><b>{language} tags</b>: {tl}</small>"
 
         
         label = Gtk.Label(label=label_text, use_markup=True, margin_top=10)
@@ -64,8 +72,6 @@ class CustomTagEntry(CustomPopover):
             Gtk.Label(label="<small>Press Enter or ESC to close without saving</small>", use_markup=True, margin_top=10, css_classes=['dim-label'])
         )
 
-        # self.flowbox_child.set_as_selected()
-
         self.set_content(popover_content)
         self.show()
 
@@ -75,4 +81,4 @@ class CustomTagEntry(CustomPopover):
         return True
 
     def on_close(self):
-        self.flowbox_child.deselect()
+        pass
@@ -1,31 +1,61 @@
 import gi
-from .CustomTagEntry import CustomTagEntry
+from typing import Optional
+from .EmojiListItem import EmojiListItem
 
 gi.require_version('Gtk', '4.0')
 
-from gi.repository import Gtk, Gio  # noqa
+from gi.repository import Gtk  # noqa
 
 
 class EmojiButton(Gtk.Button):
-    def __init__(self, data: dict, **kwargs):
-        super().__init__(label=data['emoji'], **kwargs)
+    def __init__(self, item: Optional[EmojiListItem] = None, **kwargs):
+        super().__init__(**kwargs)
 
-        self.app_settings = Gio.Settings.new('it.mijorus.smile')
+        # The emoji size is a css class on the container (font-size is inherited),
+        # so buttons don't listen to settings changes
+        self.item: Optional[EmojiListItem] = None
+        self._item_handler_id = None
 
-        self.emoji_data = data
-        self.hexcode = data['hexcode']
-        self.history = None
-        
-        self.base_skintone_widget = None
+        if item:
+            self.bind_item(item)
 
+    @property
+    def emoji_data(self) -> dict:
+        return self.item.emoji_data
+
+    @property
+    def hexcode(self) -> str:
+        return self.item.hexcode
+
+    @property
+    def base_skintone_item(self) -> Optional[EmojiListItem]:
+        return self.item.base_skintone_item
+
+    def bind_item(self, item: EmojiListItem, label: Optional[str] = None):
+        """Attaches the button to an item, recycled buttons are re-bound many times"""
+        self.unbind_item()
+
+        self.item = item
+        self._item_handler_id = item.connect('notify::selected', lambda i, p: self.update_css_classes())
+
+        self.set_label(label or item.emoji_data['emoji'])
         self.update_css_classes()
 
-        self.app_settings.connect('changed::emoji-size-class', lambda w, val: self.update_css_classes())
+    def unbind_item(self):
+        if self.item and self._item_handler_id:
+            self.item.disconnect(self._item_handler_id)
+
+        self.item = None
+        self._item_handler_id = None
 
     def update_css_classes(self):
-        self.emoji_button_css = [self.app_settings.get_string('emoji-size-class')]
+        self.emoji_button_css = []
+
+        if self.item:
+            if self.item.has_skintones():
+                self.emoji_button_css.append('emoji-with-skintones')
+
+            if self.item.selected:
+                self.emoji_button_css.append('selected')
 
-        if ('skintones' in self.emoji_data) and self.emoji_data['skintones']:
-            self.emoji_button_css.append('emoji-with-skintones')
-            
         self.set_css_classes(self.emoji_button_css)
@@ -0,0 +1,23 @@
+import gi
+
+from gi.repository import GObject  # noqa
+
+
+class EmojiListItem(GObject.Object):
+    """Lightweight model item for the emoji grid, one per emoji.
+
+    Widgets are recycled by the grid, so any state that must survive scrolling
+    (like being part of a multi-selection) lives here instead of on the button.
+    """
+
+    selected = GObject.Property(type=bool, default=False)
+
+    def __init__(self, data: dict, base_skintone_item=None):
+        super().__init__()
+
+        self.emoji_data = data
+        self.hexcode = data['hexcode']
+        self.base_skintone_item = base_skintone_item
+
+    def has_skintones(self) -> bool:
+        return ('skintones' in self.emoji_data) and bool(self.emoji_data['skintones'])
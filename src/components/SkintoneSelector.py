@@ -1,10 +1,12 @@
 import gi
-from ..assets.emoji_list import emojis
 from ..lib.custom_tags import set_custom_tags, get_custom_tags
 from ..lib.localized_tags import get_localized_tags, get_countries_list
 from .CustomPopover import CustomPopover
 from .EmojiButton import EmojiButton
+from .EmojiListItem import EmojiListItem
 from .FlowBoxChild import FlowBoxChild
+from ..lib.app_settings import get_app_settings
+from ..lib.skintones import get_skintone_table
 
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
@@ -13,10 +15,11 @@ from gi.repository import Gtk, Gio, Gdk, GLib, Adw  # noqa
 
 
 class SkintoneSelector(CustomPopover):
-    def __init__(self, flowbox_child: Gtk.FlowBoxChild, parent: Gtk.Window, click_handler: callable, keypress_handler: callable, emoji_active_selection: list[EmojiButton]):
+    def __init__(self, base_item: EmojiListItem, parent: Gtk.Window, click_handler: callable, keypress_handler: callable, emoji_active_selection: list[EmojiListItem]):
         super().__init__(parent=parent)
         self.click_handler = click_handler
-        self.flowbox_child = flowbox_child
+        self.base_item = base_item
+        self.skintone_children: list[FlowBoxChild] = []
 
         popover_content = Gtk.Box(
             orientation=Gtk.Orientation.VERTICAL,
@@ -29,6 +32,7 @@ class SkintoneSelector(CustomPopover):
 
         skintone_emojis = Gtk.FlowBox(
             orientation=Gtk.Orientation.HORIZONTAL,
+            css_classes=[get_app_settings().get_string('emoji-size-class')],
             max_children_per_line=100,
             min_children_per_line=100,
             hexpand=True,
@@ -49,20 +53,16 @@ class SkintoneSelector(CustomPopover):
         popover_container.set_propagate_natural_width(True)
         popover_container.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.NEVER)
 
-        relative_widget_hexcode = flowbox_child.emoji_button.emoji_data['hexcode']
-        for skintone in emojis[relative_widget_hexcode]['skintones']:
-            button = EmojiButton(skintone, width_request=55)
-            button.base_skintone_widget = flowbox_child
+        for skintone in get_skintone_table().get_variants(base_item.hexcode):
+            button = EmojiButton(EmojiListItem(skintone, base_skintone_item=base_item), width_request=55)
             button.connect('clicked', self.handle_activate)
 
             child = FlowBoxChild(emoji_button=button)
 
-            for e in emoji_active_selection:
-                if e.hexcode == button.emoji_data['hexcode']:
-                    child.set_as_selected()
-                    break
-
             skintone_emojis.append(child)
+            self.skintone_children.append(child)
+
+        self.update_selected_children(emoji_active_selection)
 
         popover_container.set_child(skintone_emojis)
         popover_content.append(popover_container)
@@ -85,13 +85,17 @@ class SkintoneSelector(CustomPopover):
         self.click_handler(_)
         return True
 
-    def check_skintone(flowbox_child):
-        relative_widget_hexcode = flowbox_child.emoji_button.emoji_data['hexcode']
-        if ('skintones' in emojis[relative_widget_hexcode]):
-            for skintone in emojis[relative_widget_hexcode]['skintones']:
-                return True
+    def update_selected_children(self, emoji_active_selection: list[EmojiListItem]):
+        selected_hexcodes = [e.hexcode for e in emoji_active_selection]
+
+        for child in self.skintone_children:
+            if child.emoji_button.hexcode in selected_hexcodes:
+                child.set_as_selected()
+            else:
+                child.deselect()
 
-        return False
+    def check_skintone(item: EmojiListItem):
+        return get_skintone_table().has_variants(item.hexcode)
 
     def on_close(self):
         pass
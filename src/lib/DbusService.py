@@ -1,6 +1,15 @@
 import gi
+from time import perf_counter
 from typing import Optional
-from ..utils import portal
+from ..assets.emoji_list import emojis
+from .app_settings import get_app_settings
+from .search_index import get_search_index
+from .skintones import get_skintone_table
+from .localized_tags import get_tags_locales
+from .emoji_history import get_history_store, get_history_ranks
+from .selection_buffer import create_text_content_provider
+from .search_worker import SearchWorker
+from . import profiler
 
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
@@ -9,36 +18,126 @@ from gi.repository import Gtk, Gio, Gdk, Adw, GLib  # noqa
 
 GNOME_EXTENSION_LINK = 'https://extensions.gnome.org/extension/6096/smile-complementary-extension/'
 GNOME_EXTENSION_UUID = 'smile-extension@mijorus.it'
+# the state GNOME Shell reports for an extension that has just been removed
+GNOME_EXTENSION_STATE_UNINSTALLED = 99
 
 DBUS_SERVICE_INTERFACE = 'it.mijorus.smile'
 DBUS_SERVICE_PATH = '/it/mijorus/smile/actions'
+DBUS_ERROR_UNKNOWN_EMOJI = 'it.mijorus.smile.Error.UnknownEmoji'
 DBUS_NODE_XML = """
-    <node>"
-      <interface name='it.mijorus.smile'>"
-        <signal name='CopiedEmoji'>"
-          <arg type='s' name='msg'>"
-          </arg>"
-        </signal>"
-      </interface>"
+    <node>
+      <interface name='it.mijorus.smile'>
+        <signal name='CopiedEmoji'>
+          <arg type='s' name='msg'/>
+        </signal>
+        <method name='Search'>
+          <arg type='s' name='query' direction='in'/>
+          <arg type='u' name='limit' direction='in'/>
+          <arg type='a(ss)' name='results' direction='out'/>
+        </method>
+        <method name='Copy'>
+          <annotation name='org.gtk.GDBus.DocString' value='Copies an emoji to the clipboard. On Wayland the clipboard only changes while Smile has the focus: call Show first, or the copy may be ignored.'/>
+          <arg type='s' name='hexcode' direction='in'/>
+        </method>
+        <method name='Show'/>
+        <method name='GetHistory'>
+          <arg type='a(ss)' name='emojis' direction='out'/>
+        </method>
+      </interface>
     </node>
 """
 
 class DbusService():
     dbus_connection = None
-    extension_status = 'not_installed' # installed, not_installed, unavailable 
+    # installed, not_installed, unavailable; unavailable until detect_extension() gets an answer from GNOME Shell
+    extension_status = 'unavailable'
 
     def __init__(self):
         self.node = Gio.DBusNodeInfo.new_for_xml(DBUS_NODE_XML)
+        self.extensions_proxy: Optional[Gio.DBusProxy] = None
+        # set while the first answer of GNOME Shell is awaited, for the trace of --profile
+        self.detection_start: Optional[float] = None
+        # every call gets its own results, a newer search doesn't cancel the others
+        self.search_worker = SearchWorker(drop_stale=False)
 
+    def detect_extension(self):
+        """Asks GNOME Shell whether the extension is installed, without blocking; the status follows later changes"""
+        if self.extensions_proxy or (self.detection_start is not None):
+            return
+
+        self.detection_start = perf_counter()
+
+        Gio.DBusProxy.new_for_bus(
+            Gio.BusType.SESSION,
+            Gio.DBusProxyFlags.DO_NOT_LOAD_PROPERTIES | Gio.DBusProxyFlags.DO_NOT_AUTO_START,
+            None,
+            'org.gnome.Shell.Extensions',
+            '/org/gnome/Shell/Extensions',
+            'org.gnome.Shell.Extensions',
+            None,
+            self.on_extensions_proxy_ready,
+        )
+
+    def on_extensions_proxy_ready(self, source, result):
+        try:
+            self.extensions_proxy = Gio.DBusProxy.new_for_bus_finish(result)
+        except GLib.Error:
+            DbusService.extension_status = 'unavailable'
+            self.end_detection()
+            return
+
+        self.extensions_proxy.connect('g-signal', self.on_extensions_signal)
+        # GNOME Shell restarts on X11
+        self.extensions_proxy.connect('notify::g-name-owner', lambda proxy, param: self.update_extension_status())
+        self.update_extension_status()
+
+    def update_extension_status(self):
+        if not self.extensions_proxy.get_name_owner():
+            DbusService.extension_status = 'unavailable'
+            self.end_detection()
+            return
+
+        self.extensions_proxy.call(
+            'GetExtensionInfo',
+            GLib.Variant('(s)', (GNOME_EXTENSION_UUID,)),
+            Gio.DBusCallFlags.NONE,
+            -1,
+            None,
+            self.on_extension_info,
+        )
+
+    def on_extension_info(self, proxy: Gio.DBusProxy, result):
         try:
-            inter = portal('org.gnome.Shell.Extensions', 'org.gnome.Shell.Extensions', '/org/gnome/Shell/Extensions')
-            installed_extensions = [str(k) for k in inter.ListExtensions().keys()]
-            DbusService.extension_status = 'installed' if GNOME_EXTENSION_UUID in installed_extensions else 'not_installed'
-        except Exception as e:
+            info = proxy.call_finish(result).unpack()[0]
+        except GLib.Error:
             DbusService.extension_status = 'unavailable'
+            self.end_detection()
+            return
+
+        self.set_extension_info(info)
+        self.end_detection()
+
+    def end_detection(self):
+        # only the first answer is recorded, the later ones follow changes of the extension
+        if self.detection_start is not None:
+            profiler.add_span('GNOME extension detection', self.detection_start, perf_counter())
+            self.detection_start = None
+
+    def on_extensions_signal(self, proxy: Gio.DBusProxy, sender: str, signal_name: str, params: GLib.Variant):
+        if signal_name == 'ExtensionStateChanged':
+            uuid, info = params.unpack()
+
+            if uuid == GNOME_EXTENSION_UUID:
+                self.set_extension_info(info)
+
+    def set_extension_info(self, info: dict):
+        # an empty dict is the answer for an unknown extension
+        installed = bool(info) and (info.get('state') != GNOME_EXTENSION_STATE_UNINSTALLED)
+        DbusService.extension_status = 'installed' if installed else 'not_installed'
 
     def connect(self):
-        if (DbusService.extension_status != 'unavailable') and (not self.dbus_connection):
+        # the methods are useful without the extension too, e.g. for launchers and scripts
+        if not self.dbus_connection:
             Gio.bus_own_name(
                 Gio.BusType.SESSION,
                 DBUS_SERVICE_INTERFACE,
@@ -49,7 +148,71 @@ class DbusService():
             )
 
     def handle_method_call(self, connection, sender, object_path, interface_name, method_name, params, invocation):
-        pass
+        """Serves the methods of the interface from the running instance, with the index and the history it has in memory
+
+        Search and GetHistory return (hexcode, emoji) pairs, emojis have the default skintone applied.
+        Search runs in a worker thread and returns later, the main loop is never blocked by it.
+        Copy only works while the window has the focus on Wayland, where compositors ignore
+        clipboard changes from unfocused clients: callers should call Show first.
+        """
+        args = params.unpack()
+
+        if method_name == 'Search':
+            query, limit = args
+            self.search(query, limit, lambda results: invocation.return_value(GLib.Variant('(a(ss))', (results,))))
+
+        elif method_name == 'Copy':
+            hexcode = args[0]
+            text = self.get_emoji_text(hexcode)
+
+            if text is None:
+                invocation.return_dbus_error(DBUS_ERROR_UNKNOWN_EMOJI, f'No emoji with hexcode {hexcode}')
+                return
+
+            get_history_store().increment(hexcode)
+            Gdk.Display.get_default().get_clipboard().set_content(create_text_content_provider(text))
+            invocation.return_value(None)
+
+        elif method_name == 'Show':
+            Gio.Application.get_default().activate()
+            invocation.return_value(None)
+
+        elif method_name == 'GetHistory':
+            ranks = get_history_ranks()
+            history = [(h, self.get_emoji_text(h)) for h in sorted(ranks, key=ranks.get)]
+            invocation.return_value(GLib.Variant('(a(ss))', ([e for e in history if e[1] is not None],)))
+
+    def search(self, query: str, limit: int, callback: callable):
+        """Searches in the worker thread, then calls callback() with the (hexcode, emoji) pairs on the main thread"""
+        settings = get_app_settings()
+        search_index = get_search_index()
+        use_localized_tags = settings.get_boolean('use-localized-tags')
+        merge_english_tags = settings.get_boolean('merge-english-tags')
+        locales = get_tags_locales(settings) if use_localized_tags else None
+        datadir = Gio.Application.get_default().datadir
+        history_ranks = get_history_ranks()
+
+        def search() -> list[str]:
+            if locales:
+                search_index.set_locales(locales, datadir)
+
+            return search_index.search(query, use_localized_tags, merge_english_tags, history_ranks)
+
+        def on_results(results: list[str]):
+            callback([(h, self.get_emoji_text(h)) for h in (results[:limit] if limit else results)])
+
+        self.search_worker.submit(search, on_results)
+
+    def get_emoji_text(self, hexcode: str) -> Optional[str]:
+        """Returns the emoji of a hexcode, with the default skintone for base emojis; None if it's unknown"""
+        skintones = get_skintone_table()
+
+        if hexcode in emojis:
+            variant = skintones.get_variant(hexcode, get_app_settings().get_string('skintone-modifier'))
+            return variant['emoji'] if variant else emojis[hexcode]['emoji']
+
+        variant = skintones.get_variant_by_hexcode(hexcode)
+        return variant['emoji'] if variant else None
 
     def on_bus_acquired(self, connection, name):
         DbusService.dbus_connection = connection
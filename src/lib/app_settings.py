@@ -0,0 +1,90 @@
+from typing import Optional
+
+from gi.repository import Gio  # noqa
+
+APPLICATION_ID = 'it.mijorus.smile'
+
+
+class AppSettings():
+    """A single Gio.Settings shared by the whole process
+
+    Values are cached after the first read and a single 'changed' handler
+    fans out the notifications, so widgets don't need their own Gio.Settings.
+    Callbacks receive (settings, key) like the 'changed' signal of Gio.Settings.
+    """
+
+    def __init__(self, schema_id: str):
+        self.settings = Gio.Settings.new(schema_id)
+        self._cache: dict = {}
+        self._listeners: dict[int, tuple[Optional[str], callable]] = {}
+        self._next_listener_id = 1
+
+        self.settings.connect('changed', self._on_changed)
+
+    def _get(self, key: str):
+        if not key in self._cache:
+            self._cache[key] = self.settings.get_value(key).unpack()
+
+        return self._cache[key]
+
+    def _on_changed(self, settings: Gio.Settings, key: str):
+        self._cache.pop(key, None)
+
+        for listener_key, callback in list(self._listeners.values()):
+            if (listener_key is None) or (listener_key == key):
+                callback(self, key)
+
+    def get_string(self, key: str) -> str:
+        return self._get(key)
+
+    def get_boolean(self, key: str) -> bool:
+        return self._get(key)
+
+    def get_int(self, key: str) -> int:
+        return self._get(key)
+
+    def get_strv(self, key: str) -> list[str]:
+        return list(self._get(key))
+
+    def set_string(self, key: str, value: str):
+        self.settings.set_string(key, value)
+
+    def set_boolean(self, key: str, value: bool):
+        self.settings.set_boolean(key, value)
+
+    def set_int(self, key: str, value: int):
+        self.settings.set_int(key, value)
+
+    def set_strv(self, key: str, value: list[str]):
+        self.settings.set_strv(key, value)
+
+    def bind(self, key: str, obj, prop: str, flags: Gio.SettingsBindFlags):
+        self.settings.bind(key, obj, prop, flags)
+
+    def connect(self, signal: str, callback: callable) -> int:
+        """Supports 'changed' and 'changed::key', returns an id for disconnect()"""
+        key = signal.split('::')[1] if '::' in signal else None
+
+        # GSettings only notifies about keys that have been read at least once
+        if key:
+            self._get(key)
+
+        listener_id = self._next_listener_id
+        self._listeners[listener_id] = (key, callback)
+        self._next_listener_id += 1
+
+        return listener_id
+
+    def disconnect(self, listener_id: int):
+        self._listeners.pop(listener_id, None)
+
+
+_app_settings: Optional[AppSettings] = None
+
+def get_app_settings() -> AppSettings:
+    global _app_settings
+
+    if _app_settings is None:
+        _app_settings = AppSettings(APPLICATION_ID)
+
+    return _app_settings
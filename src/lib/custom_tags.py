@@ -1,15 +1,47 @@
-from gi.repository import GLib
-from .user_config import save_json_config, read_json_config
+from typing import Optional
+from .user_config import save_json_config, read_json_config, connect_json_config_changed
 
-custom_tags_config = None
+# read_json_config() keeps the parsed document in memory, so there is no need for a copy here
+
+_custom_tags_listeners: list[callable] = []
+
+def connect_custom_tags_changed(callback: callable):
+    """Calls callback(hexcode, tags) every time the custom tags of an emoji change, in this process or in another one"""
+    if not _custom_tags_listeners:
+        connect_json_config_changed('custom_tags', _on_custom_tags_file_changed)
+
+    _custom_tags_listeners.append(callback)
+
+def _get_tags(conf: dict, hexcode: str) -> Optional[str]:
+    entry = conf.get(hexcode)
+    return entry.get('tags') if isinstance(entry, dict) else None
+
+def _on_custom_tags_file_changed(previous_conf, conf):
+    # a hand-edited file may hold anything, what is not a dict counts as empty
+    previous_conf = previous_conf if isinstance(previous_conf, dict) else {}
+    conf = conf if isinstance(conf, dict) else {}
+
+    for hexcode in set([*previous_conf.keys(), *conf.keys()]):
+        previous_tags = _get_tags(previous_conf, hexcode)
+        tags = _get_tags(conf, hexcode)
+
+        if tags != previous_tags:
+            _emit_custom_tags_changed(hexcode, tags)
+
+def _emit_custom_tags_changed(hexcode: str, tags: str or None):
+    for callback in _custom_tags_listeners:
+        callback(hexcode, tags)
+
+def _read_custom_tags() -> dict:
+    # an unreadable file counts as empty
+    conf = read_json_config('custom_tags')
+    return conf if isinstance(conf, dict) else {}
 
 def set_custom_tags(hexcode: str, tags: str):
     """Saves the new tags for a given emoji in a configuration file"""
-    global custom_tags_config
-
-    current_conf = read_json_config('custom_tags')
+    current_conf = _read_custom_tags()
 
-    if not hexcode in current_conf:
+    if not isinstance(current_conf.get(hexcode), dict):
         current_conf[hexcode] = {}
 
     if not 'tags' in current_conf[hexcode]:
@@ -20,32 +52,35 @@ def set_custom_tags(hexcode: str, tags: str):
     else:
         current_conf[hexcode]['tags'] = tags if tags.endswith(',') else f'{tags},'
 
-    res = save_json_config(current_conf, 'custom_tags')
-    custom_tags_config = current_conf
+    save_json_config(current_conf, 'custom_tags')
+
+    _emit_custom_tags_changed(hexcode, _get_tags(current_conf, hexcode))
 
-def get_custom_tags(hexcode: str, cache=False) -> str:
-    global custom_tags_config
+def get_custom_tags(hexcode: str) -> str:
+    return _get_tags(_read_custom_tags(), hexcode) or ''
 
-    if (not cache) or (not custom_tags_config):
-        custom_tags_config = read_json_config('custom_tags')
-        
-    if (hexcode in custom_tags_config) and custom_tags_config[hexcode]['tags']:
-        return custom_tags_config[hexcode]['tags']
-    
-    return ''
+def import_custom_tags(conf: dict):
+    """Replaces all the custom tags, for example when restoring a backup"""
+    previous_conf = _read_custom_tags()
+
+    # entries that are not a dict can't hold tags, they are left out instead of failing halfway
+    conf = {hexcode: entry for hexcode, entry in conf.items() if isinstance(entry, dict)}
+    save_json_config(conf, 'custom_tags')
+
+    for hexcode in set([*previous_conf.keys(), *conf.keys()]):
+        _emit_custom_tags_changed(hexcode, _get_tags(conf, hexcode))
 
 def get_all_custom_tags() -> dict:
-    return read_json_config('custom_tags')
+    return _read_custom_tags()
 
 def delete_custom_tags(hexcode: str) -> dict:
-    global custom_tags_config
-
-    conf = read_json_config('custom_tags')
+    conf = _read_custom_tags()
 
-    if 'tags' in conf[hexcode]:
+    if isinstance(conf.get(hexcode), dict) and ('tags' in conf[hexcode]):
         conf[hexcode]['tags'] = None
 
     save_json_config(conf, 'custom_tags')
-    custom_tags_config = conf
 
-    return True
\ No newline at end of file
+    _emit_custom_tags_changed(hexcode, None)
+
+    return True
@@ -1,39 +1,220 @@
-import gi
+import json
+import math
+import heapq
+import threading
 from time import time
-from .user_config import read_json_config, save_json_config
-from gi.repository import Gtk, Gio, Gdk
+from typing import Optional
+from .user_config import read_json_config, save_json_config_raw, connect_json_config_changed
+from .app_settings import get_app_settings
+from gi.repository import GLib
 
-history: dict = None
+# The usage history lives in memory: clicks only update the dict,
+# the file is written in the background a few seconds later
+# and when the application shuts down.
+#
+# Emojis are ranked by frecency: every use adds 1 to a score
+# that halves every FRECENCY_HALF_LIFE seconds.
 
-def increment_emoji_usage_counter(button: Gtk.Button):
-    global history
-    max_history_size = 30
-    
-    emoji_hexcode = button.hexcode
-    history = read_json_config('usage_history')
+FRECENCY_HALF_LIFE = 7 * 24 * 60 * 60
 
-    if not emoji_hexcode in history:
-        history[emoji_hexcode] = {}
-        history[emoji_hexcode]['count'] = 0
+def frecency_key(entry: dict) -> float:
+    """A time independent sort key for the frecency of an entry
 
+    The decayed score is score * 2^(-(now - lastUsage) / half life), so comparing
+    log2(score) + lastUsage / half life gives the same order at any point in time.
+    """
+    score = entry.get('score', entry.get('count', 1))
+    return math.log2(max(score, 1e-9)) + (entry.get('lastUsage', 0) / FRECENCY_HALF_LIFE)
 
-    history[emoji_hexcode]['count'] += 1
-    history[emoji_hexcode]['lastUsage'] = round(time())
-    
-    if (len(history) > max_history_size):
-        sorted_h = dict( sorted(history.items(), key=lambda kv:kv[1]['lastUsage']) )
-        older_key = [*sorted_h][0]
-        del history[older_key]
+class HistoryStore():
+    def __init__(self, filename: str = 'usage_history', max_size: int = 200, flush_delay: int = 3):
+        self.filename = filename
+        self.max_size = max_size
+        self.flush_delay = flush_delay
 
-    button.recent = True
+        self.history: dict = read_json_config(filename) or {}
 
-    save_json_config(history, 'usage_history')
+        # (frecency key, sequence, hexcode); entries whose key is outdated are skipped when popped
+        self._heap: list[tuple[float, int, str]] = []
+        self._sequence = 0
+        self._ranks: Optional[dict[str, int]] = None
 
+        self._rebuild_heap()
 
-def get_history(cache=True) -> dict:
-    global history
+        self._flush_source_id = None
+        self._dirty = False
+        self._write_lock = threading.Lock()
+        self._write_generation = 0
+        self._write_thread: Optional[threading.Thread] = None
 
-    if (history == None):
-        history = read_json_config('usage_history')
+        self._listeners: list[callable] = []
+        connect_json_config_changed(filename, lambda previous, history: self.merge(history))
 
-    return history
\ No newline at end of file
+    def _push(self, hexcode: str):
+        self._sequence += 1
+        heapq.heappush(self._heap, (frecency_key(self.history[hexcode]), self._sequence, hexcode))
+
+    def _rebuild_heap(self):
+        self._heap = []
+        for hexcode in sorted(self.history, key=lambda h: self.history[h].get('lastUsage', 0)):
+            self._push(hexcode)
+
+    def _evict_least_used(self) -> bool:
+        """Removes the entry with the lowest frecency, returns False if the heap had no valid entry left"""
+        while self._heap:
+            key, seq, hexcode = heapq.heappop(self._heap)
+
+            if (hexcode in self.history) and (frecency_key(self.history[hexcode]) == key):
+                del self.history[hexcode]
+                return True
+
+        return False
+
+    def _evict(self):
+        while len(self.history) > self.max_size:
+            if not self._evict_least_used():
+                # the heap is out of sync with the history, start over from the entries
+                self._rebuild_heap()
+
+                if not self._evict_least_used():
+                    break
+
+        # stale entries pile up in the heap, rebuild it once in a while
+        if len(self._heap) > (self.max_size * 4):
+            self._rebuild_heap()
+
+    def set_max_size(self, max_size: int):
+        self.max_size = max_size
+
+        if len(self.history) > max_size:
+            self._evict()
+            self._changed()
+            self._notify_listeners()
+
+    def increment(self, hexcode: str):
+        self.increment_many([hexcode])
+
+    def increment_many(self, hexcodes: list[str]):
+        """Records a use of every emoji, as a single change of the history"""
+        if not hexcodes:
+            return
+
+        now = round(time())
+
+        for hexcode in hexcodes:
+            if not hexcode in self.history:
+                self.history[hexcode] = {}
+                self.history[hexcode]['count'] = 0
+
+            entry = self.history[hexcode]
+            previous_score = entry.get('score', entry['count'])
+            elapsed = now - entry.get('lastUsage', now)
+
+            entry['count'] += 1
+            entry['score'] = (previous_score * math.pow(2, -elapsed / FRECENCY_HALF_LIFE)) + 1
+            entry['lastUsage'] = now
+
+            self._push(hexcode)
+
+        self._evict()
+        self._changed()
+        self._notify_listeners()
+
+    def merge(self, history: dict):
+        """Takes the uses recorded by another instance, keeping the latest entry of every emoji"""
+        for hexcode, entry in history.items():
+            if entry.get('lastUsage', 0) > self.history.get(hexcode, {}).get('lastUsage', -1):
+                self.history[hexcode] = entry
+
+        self._rebuild_heap()
+        self._evict()
+        self._ranks = None
+        self._notify_listeners()
+
+    def connect_changed(self, callback: callable):
+        """Calls callback() when the history changes, e.g. through D-Bus or in another instance"""
+        self._listeners.append(callback)
+
+    def _notify_listeners(self):
+        for callback in self._listeners:
+            callback()
+
+    def get_ranks(self) -> dict[str, int]:
+        """Returns {hexcode: rank}, 0 being the emoji with the highest frecency"""
+        if self._ranks is None:
+            ordered = sorted(self.history, key=lambda h: frecency_key(self.history[h]), reverse=True)
+            self._ranks = {h: i for i, h in enumerate(ordered)}
+
+        return self._ranks
+
+    def _changed(self):
+        self._ranks = None
+        self._dirty = True
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        """Coalesces all the changes of the next few seconds in a single write"""
+        if self._flush_source_id is None:
+            self._flush_source_id = GLib.timeout_add_seconds(self.flush_delay, self._on_flush_timeout)
+
+    def _on_flush_timeout(self):
+        self._flush_source_id = None
+        self.flush(blocking=False)
+
+        return GLib.SOURCE_REMOVE
+
+    def flush(self, blocking=True):
+        """Writes the history if it changed; pass blocking=False to write from a worker thread"""
+        if self._flush_source_id is not None:
+            GLib.source_remove(self._flush_source_id)
+            self._flush_source_id = None
+
+        if blocking and self._write_thread:
+            self._write_thread.join()
+
+        if not self._dirty:
+            return
+
+        self._dirty = False
+        self._write_generation += 1
+        content = json.dumps(self.history)
+
+        if blocking:
+            self._write(content, self._write_generation)
+        else:
+            self._write_thread = threading.Thread(target=self._write, args=(content, self._write_generation), daemon=True)
+            self._write_thread.start()
+
+    def _write(self, content: str, generation: int):
+        with self._write_lock:
+            # a newer snapshot is about to be written
+            if generation != self._write_generation:
+                return
+
+            save_json_config_raw(content, self.filename)
+
+
+_history_store: Optional[HistoryStore] = None
+
+def get_history_store() -> HistoryStore:
+    global _history_store
+
+    if _history_store is None:
+        settings = get_app_settings()
+
+        _history_store = HistoryStore(max_size=settings.get_int('history-size'))
+        settings.connect('changed::history-size', lambda s, k: _history_store.set_max_size(s.get_int(k)))
+
+    return _history_store
+
+def increment_emoji_usage_counters(items: list):
+    get_history_store().increment_many([item.hexcode for item in items])
+
+    for item in items:
+        item.recent = True
+
+def get_history() -> dict:
+    return get_history_store().history
+
+def get_history_ranks() -> dict[str, int]:
+    return get_history_store().get_ranks()
@@ -1,17 +1,297 @@
-import json
+# Localized tags are shipped as one binary pack per locale, generated by
+# precompile/emoji_locales/generate_locales.py
+#
+# A pack is memory-mapped and queried in place: the tokens are normalized and
+# sorted ahead of time, so a prefix lookup is a bisect over the token records,
+# and nothing is decoded until a search or a popover needs it.
+#
+# Layout (little endian):
+#   header           see HEADER below
+#   string index     u32[string_count + 1], offsets into the string blob
+#   string blob      utf-8 strings (hexcodes, emojis, tokens and tags)
+#   token records    u32 token string, u32 postings start, u32 postings count; sorted by token
+#   item records     u32 hexcode string, u32 tokens start, u32 tokens count,
+#                    u32 tags start, u32 tags count; sorted by hexcode
+#   postings         u32 item index, for every token
+#   item tokens      u32 token index, for every item
+#   tags             u32 string, the original tags of every item
 
-_active_localized_tags = {'lang': None, 'data': {}}
+import os
+import sys
+import mmap
+import heapq
+import struct
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import groupby
+from typing import Iterator, Optional
+from .tag_normalization import normalize_tag
 
-def get_localized_tags(lang: str, emoji_hexcode: str, datadir: str) -> list:
-    global _active_localized_tags
-    if _active_localized_tags['lang'] != lang:
-        with open(file=datadir + f'/assets/emoji_locales/{lang}.json', mode='r') as f:
-            _active_localized_tags = {'lang': lang, 'data': json.load(f)}
+MAGIC = b'SMLT'
+VERSION = 2
+
+# magic, version, reserved, string count, string index offset, token count, tokens offset,
+# item count, items offset, postings offset, item tokens offset, tags offset
+HEADER = struct.Struct('<4sHHIIIIIIIII')
+U32 = struct.Struct('<I')
+TOKEN_RECORD = struct.Struct('<III')
+ITEM_RECORD = struct.Struct('<IIIII')
+
+
+class _StringColumn():
+    """Lazily decoded strings of a record column, a sequence that bisect can search"""
+
+    def __init__(self, pack: 'LocalePack', offset: int, record: struct.Struct, count: int):
+        self.pack = pack
+        self.offset = offset
+        self.record = record
+        self.count = count
+        self.cache: list[Optional[str]] = [None] * count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> str:
+        value = self.cache[i]
+
+        if value is None:
+            value = self.pack._string(U32.unpack_from(self.pack._buf, self.offset + (self.record.size * i))[0])
+            self.cache[i] = value
+
+        return value
+
+
+class LocalePack():
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, _, string_count, self._string_index_offset, token_count, self._tokens_offset,
+            item_count, self._items_offset, self._postings_offset, self._item_tokens_offset, self._tags_offset) = HEADER.unpack_from(self._buf, 0)
+
+        if (magic != MAGIC) or (version != VERSION):
+            raise ValueError(f'{path} is not a valid locale pack')
+
+        self._strings_blob_offset = self._string_index_offset + (U32.size * (string_count + 1))
+        self._postings: dict[int, tuple[str, ...]] = {}
+
+        self.tokens = _StringColumn(self, self._tokens_offset, TOKEN_RECORD, token_count)
+        self.hexcodes = _StringColumn(self, self._items_offset, ITEM_RECORD, item_count)
+
+        # the typo index, built by the search index on first use and dropped with the pack
+        self.word_index = None
+
+    def _string(self, i: int) -> str:
+        start, end = struct.unpack_from('<II', self._buf, self._string_index_offset + (U32.size * i))
+        return self._buf[self._strings_blob_offset + start:self._strings_blob_offset + end].decode('utf-8')
+
+    def _u32_array(self, offset: int, start: int, count: int) -> tuple[int, ...]:
+        return struct.unpack_from(f'<{count}I', self._buf, offset + (U32.size * start))
+
+    def _item(self, hexcode: str) -> Optional[tuple]:
+        i = bisect_left(self.hexcodes, hexcode)
+
+        if (i < len(self.hexcodes)) and (self.hexcodes[i] == hexcode):
+            return ITEM_RECORD.unpack_from(self._buf, self._items_offset + (ITEM_RECORD.size * i))
+
+        return None
+
+    def _token_hexcodes(self, i: int) -> tuple[str, ...]:
+        if not i in self._postings:
+            _, start, count = TOKEN_RECORD.unpack_from(self._buf, self._tokens_offset + (TOKEN_RECORD.size * i))
+            self._postings[i] = tuple(self.hexcodes[item] for item in self._u32_array(self._postings_offset, start, count))
+
+        return self._postings[i]
+
+    def prefix_matches(self, prefix: str) -> Iterator[tuple[str, tuple[str, ...]]]:
+        i = bisect_left(self.tokens, prefix)
+
+        while (i < len(self.tokens)) and self.tokens[i].startswith(prefix):
+            yield self.tokens[i], self._token_hexcodes(i)
+            i += 1
+
+    def get_item_tokens(self, hexcode: str) -> list[str]:
+        item = self._item(hexcode)
+
+        if not item:
+            return []
+
+        return [self.tokens[t] for t in self._u32_array(self._item_tokens_offset, item[1], item[2])]
+
+    def get_tags(self, hexcode: str) -> list[str]:
+        """The tags of an emoji, as written by the translators"""
+        item = self._item(hexcode)
+
+        if not item:
+            return []
+
+        return [self._string(s) for s in self._u32_array(self._tags_offset, item[3], item[4])]
+
+    def warm_up(self):
+        """Decodes the token table, so the first prefix lookups don't have to"""
+        for i in range(len(self.tokens)):
+            self.tokens[i]
+
+    def get_memory_usage(self) -> int:
+        """Bytes used by the pack: the mapped file plus everything decoded so far, and its typo index"""
+        size = len(self._buf)
+
+        for column in (self.tokens, self.hexcodes):
+            size += sys.getsizeof(column.cache) + sum(sys.getsizeof(s) for s in column.cache if s is not None)
+
+        size += sys.getsizeof(self._postings) + sum(sys.getsizeof(p) for p in self._postings.values())
+
+        if self.word_index:
+            size += self.word_index.get_memory_usage()
 
-    if not emoji_hexcode in _active_localized_tags['data']:
-        return []
+        return size
 
-    return _active_localized_tags['data'][emoji_hexcode]['tags']
+
+class LocalePackGroup():
+    """Several locale packs queried as a single table
+
+    The token streams of the packs are already sorted, so they are merged
+    while walking them: a prefix is looked up once and every token is reported
+    once, with the emojis of all the locales that use it.
+    """
+
+    def __init__(self, packs: list[LocalePack]):
+        self.packs = packs
+
+    def prefix_matches(self, prefix: str) -> Iterator[tuple[str, set[str]]]:
+        if len(self.packs) == 1:
+            yield from self.packs[0].prefix_matches(prefix)
+            return
+
+        merged = heapq.merge(*[p.prefix_matches(prefix) for p in self.packs], key=lambda m: m[0])
+
+        for token, matches in groupby(merged, key=lambda m: m[0]):
+            yield token, {h for _, hexcodes in matches for h in hexcodes}
+
+
+def write_locale_pack(path: str, locale_data: dict):
+    """Writes {hexcode: {'tags': list[str]}}, as downloaded from emojibase, in the binary format"""
+    strings: list[bytes] = []
+    string_ids: dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        if not value in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value.encode('utf-8'))
+
+        return string_ids[value]
+
+    hexcodes = sorted(locale_data)
+    item_ids = {h: i for i, h in enumerate(hexcodes)}
+
+    item_tokens: dict[str, list[str]] = {}
+    postings: dict[str, list[int]] = {}
+
+    for hexcode in hexcodes:
+        tokens = list(dict.fromkeys(t for t in (normalize_tag(t) for t in locale_data[hexcode]['tags']) if t))
+        item_tokens[hexcode] = tokens
+
+        for t in tokens:
+            postings.setdefault(t, []).append(item_ids[hexcode])
+
+    tokens = sorted(postings)
+    token_ids = {t: i for i, t in enumerate(tokens)}
+
+    token_records = bytearray()
+    postings_data = bytearray()
+    postings_count = 0
+    for t in tokens:
+        token_records += TOKEN_RECORD.pack(intern(t), postings_count, len(postings[t]))
+        postings_data += struct.pack(f'<{len(postings[t])}I', *postings[t])
+        postings_count += len(postings[t])
+
+    item_records = bytearray()
+    item_tokens_data = bytearray()
+    tags_data = bytearray()
+    item_tokens_count = 0
+    tags_count = 0
+    for hexcode in hexcodes:
+        tags = locale_data[hexcode]['tags']
+        ids = [token_ids[t] for t in item_tokens[hexcode]]
+
+        item_records += ITEM_RECORD.pack(intern(hexcode), item_tokens_count, len(ids), tags_count, len(tags))
+        item_tokens_data += struct.pack(f'<{len(ids)}I', *ids)
+        tags_data += struct.pack(f'<{len(tags)}I', *[intern(t) for t in tags])
+        item_tokens_count += len(ids)
+        tags_count += len(tags)
+
+    string_index = bytearray()
+    offset = 0
+    for s in strings:
+        string_index += U32.pack(offset)
+        offset += len(s)
+
+    string_index += U32.pack(offset)
+
+    string_index_offset = HEADER.size
+    tokens_offset = string_index_offset + len(string_index) + offset
+    items_offset = tokens_offset + len(token_records)
+    postings_offset = items_offset + len(item_records)
+    item_tokens_offset = postings_offset + len(postings_data)
+    tags_offset = item_tokens_offset + len(item_tokens_data)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, 0, len(strings), string_index_offset, len(tokens), tokens_offset,
+            len(hexcodes), items_offset, postings_offset, item_tokens_offset, tags_offset
+        ))
+
+        f.write(string_index)
+        f.write(b''.join(strings))
+        f.write(token_records)
+        f.write(item_records)
+        f.write(postings_data)
+        f.write(item_tokens_data)
+        f.write(tags_data)
+
+
+# Packs stay mapped after they are used, the least recently used ones are
+# dropped when more than LOCALE_PACK_CACHE_SIZE languages have been loaded.
+LOCALE_PACK_CACHE_SIZE = 4
+
+_locale_packs: OrderedDict[str, LocalePack] = OrderedDict()
+_locale_pack_lock = threading.Lock()
+
+def get_locale_pack_path(lang: str, datadir: str) -> str:
+    return os.path.join(datadir, 'assets', 'emoji_locales', f'{lang}.bin')
+
+def get_locale_pack(lang: str, datadir: str) -> LocalePack:
+    # the lock is shared with preload_locale_pack(), a pack is never mapped twice
+    with _locale_pack_lock:
+        if lang in _locale_packs:
+            _locale_packs.move_to_end(lang)
+        else:
+            _locale_packs[lang] = LocalePack(get_locale_pack_path(lang, datadir))
+
+            while len(_locale_packs) > LOCALE_PACK_CACHE_SIZE:
+                _locale_packs.popitem(last=False)
+
+        return _locale_packs[lang]
+
+def preload_locale_pack(lang: str, datadir: str):
+    """Maps a locale pack and decodes its tokens in a worker thread"""
+    threading.Thread(target=lambda: get_locale_pack(lang, datadir).warm_up(), daemon=True).start()
+
+def get_locale_pack_memory_usage(lang: str, datadir: str) -> tuple[bool, int]:
+    """Returns whether a pack is loaded, with the memory it uses; the size of its file if it's not"""
+    with _locale_pack_lock:
+        if lang in _locale_packs:
+            return (True, _locale_packs[lang].get_memory_usage())
+
+    return (False, os.path.getsize(get_locale_pack_path(lang, datadir)))
+
+def get_tags_locales(settings) -> list[str]:
+    """The languages to search: the main one from 'tags-locale', then 'extra-tags-locales'"""
+    return list(dict.fromkeys([settings.get_string('tags-locale'), *settings.get_strv('extra-tags-locales')]))
+
+def get_localized_tags(lang: str, emoji_hexcode: str, datadir: str) -> list:
+    return get_locale_pack(lang, datadir).get_tags(emoji_hexcode)
 
 def get_countries_list() -> dict:
         return {
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import threading
+from time import perf_counter
+from functools import wraps
+from typing import Optional
+
+# Startup instrumentation
+#
+# Events are written as a Chrome trace (chrome://tracing, ui.perfetto.dev) when
+# profiling is enabled with the SMILE_PROFILE=<file> environment variable or --profile=<file>.
+# The command line is parsed after the first imports, so events are recorded
+# until end_option_parsing() says whether they are needed; then, without an
+# output path, they are dropped and nothing else is recorded.
+
+_origin = perf_counter()
+_events: list[dict] = []
+_output_path: Optional[str] = os.getenv('SMILE_PROFILE') or None
+_parsing_options = True
+
+def _get_process_start() -> Optional[float]:
+    """Returns the perf_counter() value of the exec of this process (with a resolution of a clock tick), None without /proc"""
+    try:
+        with open('/proc/self/stat') as f:
+            # the command name may contain spaces, starttime is the 20th field after it
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - (start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+    return perf_counter() - age
+
+# the interpreter startup and the imports before this module are not part of any span
+process_start: Optional[float] = _get_process_start()
+
+def _timestamp(t: float) -> float:
+    # microseconds since this module was imported
+    return round((t - _origin) * 1_000_000, 1)
+
+def set_output_path(path: Optional[str]):
+    global _output_path
+    _output_path = path
+
+def end_option_parsing():
+    global _parsing_options
+    _parsing_options = False
+
+    if not _output_path:
+        _events.clear()
+
+def is_enabled() -> bool:
+    return bool(_output_path)
+
+def _is_recording() -> bool:
+    return _parsing_options or bool(_output_path)
+
+def add_span(name: str, start: float, end: float, category: str = 'startup'):
+    """Records a span between two perf_counter() values"""
+    if not _is_recording():
+        return
+
+    _events.append({
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': _timestamp(start),
+        'dur': round((end - start) * 1_000_000, 1),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+    })
+
+def add_instant(name: str, category: str = 'startup'):
+    if not _is_recording():
+        return
+
+    _events.append({
+        'name': name,
+        'cat': category,
+        'ph': 'i',
+        's': 'p',
+        'ts': _timestamp(perf_counter()),
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+    })
+
+def add_counter(name: str, values: dict[str, float], category: str = 'startup'):
+    """Records the current values of a counter, drawn as a graph by the trace viewers"""
+    if not _is_recording():
+        return
+
+    _events.append({
+        'name': name,
+        'cat': category,
+        'ph': 'C',
+        'ts': _timestamp(perf_counter()),
+        'pid': os.getpid(),
+        'args': values,
+    })
+
+class span():
+    """Records a span around a block, usable as a context manager or a decorator"""
+
+    def __init__(self, name: str, category: str = 'startup'):
+        self.name = name
+        self.category = category
+
+    def __call__(self, func: callable) -> callable:
+        # every call gets its own span, so nested and concurrent calls keep their own start
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(self.name, self.category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add_span(self.name, self.start, perf_counter(), self.category)
+        return False
+
+def save():
+    """Writes the trace, if profiling is enabled"""
+    if not _output_path:
+        return
+
+    with open(_output_path, 'w') as f:
+        json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,503 @@
+import re
+import sys
+import threading
+from bisect import bisect_left
+from typing import Optional, Iterator, Union
+from .localized_tags import get_locale_pack, preload_locale_pack, LocalePack, LocalePackGroup
+from .tag_normalization import normalize_tag, split_tags
+from .skintones import SkintoneTable
+
+# An in-memory index over the tags of every emoji.
+#
+# Tags are normalized once when the index is built, then every source
+# (English, localized and custom tags) keeps a sorted array of unique tokens:
+# a prefix lookup is a bisect followed by a short linear walk.
+# Localized tags come from memory-mapped locale packs, that have the same layout on disk;
+# when several languages are enabled their packs are merged into a single table.
+#
+# Every hit gets a score: how well the query matches a tag (exact, prefix,
+# start of a word, substring or with a few typos), plus a bonus for custom tags
+# and for the emojis in the history.
+#
+# Tables are never changed once they are in use: new custom tags or languages
+# replace them with new ones, so a search running in a worker thread keeps
+# working on the tables it started with.
+
+EXACT_SCORE = 100
+PREFIX_SCORE = 80
+# added to PREFIX_SCORE, in proportion to how much of the tag the query covers
+PREFIX_COVERAGE_SCORE = 10
+WORD_PREFIX_SCORE = 60
+SUBSTRING_SCORE = 40
+FUZZY_SCORE = 30
+FUZZY_DISTANCE_PENALTY = 10
+
+# custom tags are set by the user, their matches come before any other
+CUSTOM_TAG_SCORE = 100
+# the most used emoji gets all of it, the least used almost nothing
+HISTORY_SCORE = 15
+
+MIN_SUBSTRING_LENGTH = 2
+# {typos: shortest query that tolerates them}, everything would match a short query with typos
+TYPO_QUERY_LENGTHS = {1: 4, 2: 8}
+# locale packs only tolerate one typo: with two, their typo index takes tens of MB per language
+LOCALE_MAX_TYPOS = 1
+# how many tags or words the typo index builders go through between two yields
+BUILD_STEP_SIZE = 32
+
+_word_separators = re.compile(r'[\s\-]+')
+
+def max_typos(query: str) -> int:
+    """How many edits are tolerated for a query"""
+    return max([typos for typos, length in TYPO_QUERY_LENGTHS.items() if len(query) >= length], default=0)
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance (a swap of two letters is one edit), capped at max_distance + 1"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous_row = None
+    row = list(range(len(b) + 1))
+
+    for i in range(1, len(a) + 1):
+        previous_row, row = row, [i] + [0] * len(b)
+
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+
+            if (i > 1) and (j > 1) and (a[i - 1] == b[j - 2]) and (a[i - 2] == b[j - 1]):
+                row[j] = min(row[j], before_previous_row[j - 2] + 1)
+
+        # a swap can only lower the next row by going back to the previous one
+        if (min(row) > max_distance) and (min(previous_row) >= max_distance):
+            return max_distance + 1
+
+        before_previous_row = previous_row
+
+    return min(row[-1], max_distance + 1)
+
+def deletion_variants(word: str, distance: int) -> set[str]:
+    """The word with up to distance letters removed"""
+    variants = {word}
+
+    for _ in range(distance):
+        variants |= {v[:i] + v[i + 1:] for v in variants for i in range(len(v))}
+
+    return variants
+
+
+def substring_score(token: str, query: str) -> int:
+    """WORD_PREFIX_SCORE or SUBSTRING_SCORE if the tag contains the query past its start, 0 if it doesn't"""
+    i = token.find(query, 1)
+
+    if i < 0:
+        return 0
+
+    while i > 0:
+        if _word_separators.match(token, i - 1):
+            return WORD_PREFIX_SCORE
+
+        i = token.find(query, i + 1)
+
+    return SUBSTRING_SCORE
+
+def index_words(tokens: list[tuple[str, set[str]]], words: dict[str, set[str]]) -> Iterator[None]:
+    """Adds the words of every tag to {word: hexcodes}, yielding every BUILD_STEP_SIZE tags"""
+    for i, (token, hexcodes) in enumerate(tokens):
+        for w in _word_separators.split(token):
+            if w:
+                words.setdefault(w, set()).update(hexcodes)
+
+        if i % BUILD_STEP_SIZE == 0:
+            yield
+
+
+def _dict_memory_usage(d: dict[str, set[str]]) -> int:
+    # the strings in the sets are the words, already counted as keys of the words dict
+    return sys.getsizeof(d) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in d.items())
+
+
+class WordIndex():
+    """Finds tags with typos and multi-word queries
+
+    Tags are split into words, then every word is stored under each of its
+    deletion variants: two words within n edits always share a variant with
+    at most n deletions, so only a handful of candidates need edit_distance().
+    The variants are built by build_steps() when the app is idle, or by the first query that needs them;
+    queries never tolerate more than max_distance typos, so larger tables are never built.
+    """
+
+    def __init__(self, tokens: list[tuple[str, set[str]]], max_distance: int = max(TYPO_QUERY_LENGTHS), words: Optional[dict[str, set[str]]] = None):
+        self.tokens = tokens
+        self.max_distance = max_distance
+        self.variants: dict[int, dict[str, set[str]]] = {}
+        # computed once by get_memory_usage(), the variants never change once built
+        self.variants_sizes: dict[int, int] = {}
+        self.lock = threading.Lock()
+
+        if words is None:
+            words = {}
+            for _ in index_words(tokens, words):
+                pass
+
+        self.words = words
+        self.sorted_words = sorted(self.words)
+
+    def _add_variants(self, distance: int, variants: dict[str, set[str]]) -> Iterator[None]:
+        for i, w in enumerate(self.words):
+            # shorter words can't be within distance of a query that allows this many typos
+            if len(w) >= TYPO_QUERY_LENGTHS[distance] - distance:
+                for v in deletion_variants(w, distance):
+                    variants.setdefault(v, set()).add(w)
+
+            if i % BUILD_STEP_SIZE == 0:
+                yield
+
+    def _variants(self, distance: int) -> dict[str, set[str]]:
+        with self.lock:
+            if not distance in self.variants:
+                variants = {}
+                for _ in self._add_variants(distance, variants):
+                    pass
+
+                self.variants[distance] = variants
+
+        return self.variants[distance]
+
+    def build_steps(self, distance: int) -> Iterator[None]:
+        """Builds the variants for distance in small steps, without holding the lock between them"""
+        if (distance > self.max_distance) or (distance in self.variants):
+            return
+
+        variants = {}
+        yield from self._add_variants(distance, variants)
+
+        with self.lock:
+            self.variants.setdefault(distance, variants)
+
+    def get_memory_usage(self) -> int:
+        """Bytes used by the words and their variants, the tags themselves belong to the table"""
+        size = sys.getsizeof(self.tokens) + sys.getsizeof(self.sorted_words) + _dict_memory_usage(self.words)
+
+        with self.lock:
+            for distance, variants in self.variants.items():
+                if not distance in self.variants_sizes:
+                    self.variants_sizes[distance] = _dict_memory_usage(variants)
+
+                size += self.variants_sizes[distance]
+
+        return size
+
+    def substring_matches(self, query: str) -> Iterator[tuple[int, set[str]]]:
+        """Yields (score, hexcodes) for the tags that contain the query, except the ones starting with it"""
+        for token, hexcodes in self.tokens:
+            score = substring_score(token, query)
+
+            if score:
+                yield score, hexcodes
+
+    def fuzzy_matches(self, query: str, max_distance: int) -> Iterator[tuple[int, set[str]]]:
+        """Yields (edit distance, hexcodes) for the words within max_distance of the query"""
+        max_distance = min(max_distance, self.max_distance)
+        if not max_distance:
+            return
+
+        variants = self._variants(max_distance)
+        candidates = set()
+
+        for v in deletion_variants(query, max_distance):
+            candidates |= variants.get(v, set())
+
+        for w in candidates:
+            distance = edit_distance(query, w, max_distance)
+
+            if 0 < distance <= max_distance:
+                yield distance, self.words[w]
+
+    def word_matches(self, word: str) -> dict[str, int]:
+        """Returns {hexcode: edit distance} for the emojis with a word that starts with this one, or is close to it"""
+        matches = {}
+
+        typos = max_typos(word)
+        if typos:
+            for distance, hexcodes in self.fuzzy_matches(word, typos):
+                for h in hexcodes:
+                    matches[h] = min(matches.get(h, distance), distance)
+
+        i = bisect_left(self.sorted_words, word)
+        while (i < len(self.sorted_words)) and self.sorted_words[i].startswith(word):
+            matches.update(dict.fromkeys(self.words[self.sorted_words[i]], 0))
+            i += 1
+
+        return matches
+
+    def multi_word_matches(self, query_words: list[str]) -> dict[str, int]:
+        """Returns {hexcode: total edit distance} for the emojis that match every word of the query, in any tag and order"""
+        matches = self.word_matches(query_words[0])
+
+        for word in query_words[1:]:
+            if not matches:
+                break
+
+            word_matches = self.word_matches(word)
+            matches = {h: d + word_matches[h] for h, d in matches.items() if h in word_matches}
+
+        return matches
+
+
+class TokenTable():
+    def __init__(self):
+        self.tokens: list[str] = []
+        self.postings: dict[str, set[str]] = {}
+        self.item_tokens: dict[str, list[str]] = {}
+        self.word_index: Optional[WordIndex] = None
+
+    def bulk_load(self, items: dict[str, list[str]]):
+        """Replaces the content of the table with a {hexcode: tokens} dict"""
+        self.postings = {}
+        self.item_tokens = items
+
+        for hexcode, tokens in items.items():
+            for t in tokens:
+                if not t in self.postings:
+                    self.postings[t] = set()
+
+                self.postings[t].add(hexcode)
+
+        self.tokens = sorted(self.postings)
+
+    def prefix_matches(self, prefix: str) -> Iterator[tuple[str, set[str]]]:
+        i = bisect_left(self.tokens, prefix)
+
+        while (i < len(self.tokens)) and self.tokens[i].startswith(prefix):
+            yield self.tokens[i], self.postings[self.tokens[i]]
+            i += 1
+
+    def get_item_tokens(self, hexcode: str) -> list[str]:
+        return self.item_tokens.get(hexcode, [])
+
+
+
+class SearchIndex():
+    def __init__(self, emojis: dict, skintones: Optional[SkintoneTable] = None):
+        self.emojis = emojis
+        self.emoji_chars: dict[str, str] = {e['emoji']: hexcode for hexcode, e in emojis.items()}
+
+        # a pasted emoji with a skintone finds that variant
+        skintones = skintones or SkintoneTable(emojis)
+        for tones in skintones.variants_by_base.values():
+            for tone in tones:
+                self.emoji_chars.setdefault(tone['emoji'], tone['hexcode'])
+
+        self.english = TokenTable()
+        self.english.bulk_load({hexcode: split_tags(e['tags']) for hexcode, e in emojis.items()})
+
+        self.localized: Union[TokenTable, LocalePackGroup] = TokenTable()
+        self.locales: tuple[str, ...] = ()
+
+        self.custom = TokenTable()
+
+        self.locales_lock = threading.Lock()
+
+        # guards the word_index of the tables, created by _word_index() or build_steps() and dropped with the table
+        self.word_indexes_lock = threading.Lock()
+
+    def _word_index(self, table) -> WordIndex:
+        with self.word_indexes_lock:
+            if table.word_index is None:
+                table.word_index = WordIndex(list(table.prefix_matches('')), self._max_distance(table))
+
+            return table.word_index
+
+    def _max_distance(self, table) -> int:
+        return LOCALE_MAX_TYPOS if isinstance(table, LocalePack) else max(TYPO_QUERY_LENGTHS)
+
+    def _word_tables(self, table) -> list:
+        # every locale pack has its own typo index, shared by all the sets of languages it's part of
+        # and dropped with the pack when it leaves the cache
+        return table.packs if isinstance(table, LocalePackGroup) else [table]
+
+    def build_steps(self) -> Iterator[None]:
+        """Builds the typo indexes of the English tags and of the languages in use in small steps, for an idle callback"""
+        tables = [self.english, *self._word_tables(self.localized)]
+
+        for table in tables:
+            word_index = table.word_index
+
+            if word_index is None:
+                tokens = list(table.prefix_matches(''))
+                words = {}
+                yield from index_words(tokens, words)
+
+                with self.word_indexes_lock:
+                    if table.word_index is None:
+                        table.word_index = WordIndex(tokens, self._max_distance(table), words)
+
+                    word_index = table.word_index
+
+            for distance in TYPO_QUERY_LENGTHS:
+                yield from word_index.build_steps(distance)
+
+    def load_custom_tags(self, custom_tags: dict):
+        custom_tokens = {}
+
+        for hexcode, config in custom_tags.items():
+            if (hexcode in self.emojis) and isinstance(config, dict) and config.get('tags'):
+                custom_tokens[hexcode] = split_tags(config['tags'])
+
+        custom = TokenTable()
+        custom.bulk_load(custom_tokens)
+        self.custom = custom
+
+    def set_custom_tags(self, hexcode: str, tags: Optional[str]):
+        """Updates the custom tags of a single emoji, the other tables are left as they are"""
+        custom_tokens = {h: tokens for h, tokens in self.custom.item_tokens.items() if h != hexcode}
+
+        if tags and (hexcode in self.emojis):
+            custom_tokens[hexcode] = split_tags(tags)
+
+        custom = TokenTable()
+        custom.bulk_load(custom_tokens)
+        self.custom = custom
+
+    def set_locales(self, langs: list[str], datadir: str):
+        """Searches the localized tags of these languages, loading the ones that are not loaded already"""
+        langs = tuple(l for l in dict.fromkeys(langs) if l != 'en')
+
+        with self.locales_lock:
+            if self.locales == langs:
+                return
+
+            self.localized = LocalePackGroup([get_locale_pack(l, datadir) for l in langs]) if langs else TokenTable()
+            self.locales = langs
+
+    def preload_locales(self, langs: list[str], datadir: str):
+        """Starts loading the localized tags of some languages in the background, before the first search needs them"""
+        for lang in dict.fromkeys(langs):
+            if (lang != 'en') and (not lang in self.locales):
+                preload_locale_pack(lang, datadir)
+
+    def search(self, query: str, use_localized_tags: bool = False, merge_english_tags: bool = True, history_ranks: dict[str, int] = None,
+               previous_query: Optional[str] = None, previous_results: Optional[set[str]] = None, custom: Optional[TokenTable] = None) -> list[str]:
+        """Returns the hexcodes matching a query, best first
+
+        See score() for the ranking, ties are broken by the catalogue order.
+        A pasted emoji only finds itself, skintone variants included.
+        """
+        if query in self.emoji_chars:
+            return [self.emoji_chars[query]]
+
+        scores = self.score(query, use_localized_tags, merge_english_tags, history_ranks, previous_query, previous_results, custom)
+        return sorted(scores, key=lambda h: (-scores[h], self.emojis[h]['order']))
+
+    def score(self, query: str, use_localized_tags: bool = False, merge_english_tags: bool = True, history_ranks: dict[str, int] = None,
+              previous_query: Optional[str] = None, previous_results: Optional[set[str]] = None, custom: Optional[TokenTable] = None) -> dict[str, float]:
+        """Returns {hexcode: score} for the emojis matching a query
+
+        Each emoji gets the score of its best matching tag: EXACT_SCORE, a prefix
+        (better when it covers more of the tag), the start of a word in the tag,
+        a substring, or a word with up to max_typos() edits.
+        Custom tags add CUSTOM_TAG_SCORE, the position in history_ranks (lower is better) adds up to HISTORY_SCORE.
+
+        custom is the table of custom tags to search, self.custom if None: a caller that
+        passes previous_results gives the table they were found in.
+        previous_results are the results of previous_query, searched in the same tables.
+        When the query extends it, every tag that contains the query belongs to one of them:
+        only their tags are scanned for substrings, the results are the same.
+        """
+        if query in self.emoji_chars:
+            return {self.emoji_chars[query]: EXACT_SCORE}
+
+        q = normalize_tag(query)
+        if not q:
+            return {}
+
+        scores: dict[str, float] = {}
+
+        def add(hexcodes, score: float):
+            for h in hexcodes:
+                # locale packs may list emojis that are not in this version of the emoji list
+                if (scores.get(h, 0) < score) and (h in self.emojis):
+                    scores[h] = score
+
+        typos = max_typos(q)
+
+        # a query of a single letter has no substring matches and a pasted emoji no tag matches,
+        # their results don't cover the longer queries
+        candidates = None
+        if (previous_results is not None) and (not previous_query in self.emoji_chars):
+            p = normalize_tag(previous_query)
+
+            if (len(p) >= MIN_SUBSTRING_LENGTH) and q.startswith(p):
+                candidates = previous_results
+
+        tables = [(custom if custom is not None else self.custom, CUSTOM_TAG_SCORE)] + [(t, 0) for t in self._tag_tables(use_localized_tags, merge_english_tags)]
+
+        for table, bonus in tables:
+            for token, hexcodes in table.prefix_matches(q):
+                if token == q:
+                    add(hexcodes, bonus + EXACT_SCORE)
+                else:
+                    add(hexcodes, bonus + PREFIX_SCORE + (PREFIX_COVERAGE_SCORE * len(q) / len(token)))
+
+            if len(q) >= MIN_SUBSTRING_LENGTH:
+                for word_table in self._word_tables(table):
+                    word_index = self._word_index(word_table)
+
+                    if candidates is None:
+                        for score, hexcodes in word_index.substring_matches(q):
+                            add(hexcodes, bonus + score)
+                    else:
+                        for h in candidates:
+                            score = max([substring_score(t, q) for t in word_table.get_item_tokens(h)], default=0)
+
+                            if score:
+                                add((h,), bonus + score)
+
+                    # "face joy" finds "face with tears of joy", "thubms up" finds "thumbs up"
+                    query_words = [w for w in _word_separators.split(q) if w]
+
+                    if typos and (len(query_words) == 1):
+                        for distance, hexcodes in word_index.fuzzy_matches(q, typos):
+                            add(hexcodes, bonus + FUZZY_SCORE - (FUZZY_DISTANCE_PENALTY * distance))
+
+                    elif len(query_words) > 1:
+                        for h, distance in word_index.multi_word_matches(query_words).items():
+                            add((h,), bonus + (SUBSTRING_SCORE if distance == 0 else FUZZY_SCORE - (FUZZY_DISTANCE_PENALTY * min(distance, 2))))
+
+        if history_ranks:
+            for h, rank in history_ranks.items():
+                if h in scores:
+                    scores[h] += HISTORY_SCORE * (1 - (rank / len(history_ranks)))
+
+        return scores
+
+    def _tag_tables(self, use_localized_tags: bool, merge_english_tags: bool) -> list:
+        tables = []
+        if use_localized_tags:
+            tables.append(self.localized)
+
+        if (not use_localized_tags) or merge_english_tags:
+            tables.append(self.english)
+
+        return tables
+
+
+_search_index: Optional[SearchIndex] = None
+
+def get_search_index() -> SearchIndex:
+    """Returns the shared search index, building it on the first call"""
+    global _search_index
+
+    if _search_index is None:
+        from ..assets.emoji_list import emojis
+        from .custom_tags import get_all_custom_tags, connect_custom_tags_changed
+        from .skintones import get_skintone_table
+
+        _search_index = SearchIndex(emojis, get_skintone_table())
+        _search_index.load_custom_tags(get_all_custom_tags())
+
+        connect_custom_tags_changed(_search_index.set_custom_tags)
+
+    return _search_index
@@ -0,0 +1,64 @@
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from gi.repository import GLib
+
+# Searches run in a single worker thread, one at a time and in order.
+#
+# Every query gets a generation number: a query that is still waiting when a
+# newer one arrives is skipped, and results that come back after a newer query
+# are dropped on the main thread, so only the latest results are shown.
+# With drop_stale=False every task runs and every callback is called, in order:
+# that's for callers that each wait for their own result, like the D-Bus methods.
+# The tasks only read the search index (see search_index.py), the main thread
+# just gets the final list of hexcodes.
+
+class SearchWorker():
+    def __init__(self, drop_stale=True):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
+        self.drop_stale = drop_stale
+        self.generation = 0
+        self.pending_generation: Optional[int] = None
+        # seconds taken by the task of the last delivered result
+        self.last_duration = 0.0
+
+    def submit(self, task: callable, callback: callable) -> int:
+        """Runs task() in the worker thread and calls callback(result) on the main thread, unless a newer task was submitted"""
+        self.generation += 1
+        self.pending_generation = self.generation
+
+        self.executor.submit(self._run, self.generation, task, callback)
+        return self.generation
+
+    def cancel(self):
+        """Drops the result of the task that is running, if any"""
+        self.generation += 1
+        self.pending_generation = None
+
+    def is_pending(self) -> bool:
+        return self.pending_generation is not None
+
+    def _run(self, generation: int, task: callable, callback: callable):
+        if self.drop_stale and (generation != self.generation):
+            return
+
+        start = perf_counter()
+
+        try:
+            result = task()
+        except Exception as e:
+            print(f'Search failed: {e}')
+            result = []
+
+        GLib.idle_add(self._deliver, generation, result, perf_counter() - start, callback)
+
+    def _deliver(self, generation: int, result, duration: float, callback: callable):
+        if generation == self.generation:
+            self.pending_generation = None
+        elif self.drop_stale:
+            return False
+
+        self.last_duration = duration
+        callback(result)
+
+        return False
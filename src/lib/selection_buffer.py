@@ -0,0 +1,83 @@
+import gi
+from typing import Optional
+from .emoji_history import increment_emoji_usage_counters
+
+gi.require_version('Gdk', '4.0')
+
+from gi.repository import Gdk, GLib  # noqa
+
+# The emojis picked with multi-select.
+#
+# Picks only change the buffer and the `selected` state of the list items;
+# the usage history is updated once, for every emoji, when the buffer is copied.
+
+CLIPBOARD_MIME_TYPES = ('text/plain;charset=utf-8', 'text/plain', 'UTF8_STRING')
+
+class SelectionBuffer():
+    def __init__(self):
+        # EmojiListItem objects and the text each of them adds
+        self.items: list = []
+        self.labels: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def get_text(self) -> str:
+        return ''.join(self.labels)
+
+    def append(self, item, label: str):
+        self.items.append(item)
+        self.labels.append(label)
+
+        item.selected = True
+
+        if item.base_skintone_item:
+            item.base_skintone_item.selected = True
+
+    def pop(self):
+        """Removes the last pick, the items stay selected if they were picked more than once"""
+        if not self.items:
+            return None
+
+        last_item = self.items.pop()
+        self.labels.pop()
+
+        if not last_item in self.items:
+            last_item.selected = False
+
+        base_item = last_item.base_skintone_item
+        if base_item and not any((i.base_skintone_item is base_item) for i in self.items):
+            base_item.selected = False
+
+        return last_item
+
+    def clear(self):
+        for item in self.items:
+            item.selected = False
+
+            if item.base_skintone_item:
+                item.base_skintone_item.selected = False
+
+        self.items = []
+        self.labels = []
+
+    def commit(self, item=None, label: Optional[str] = None) -> str:
+        """Records the use of every picked emoji, plus item if given, in a single history update
+
+        Returns the text to copy.
+        """
+        items = [*self.items, item] if item else self.items
+        text = ''.join([*self.labels, label]) if item else self.get_text()
+
+        increment_emoji_usage_counters(items)
+
+        return text
+
+
+def create_text_content_provider(text: str) -> Gdk.ContentProvider:
+    """A single provider that serves the text to GTK apps as a string and to others in the usual text formats"""
+    data = GLib.Bytes.new(text.encode('utf-8'))
+    providers = [Gdk.ContentProvider.new_for_value(text)]
+    providers += [Gdk.ContentProvider.new_for_bytes(mime_type, data) for mime_type in CLIPBOARD_MIME_TYPES]
+
+    return Gdk.ContentProvider.new_union(providers)
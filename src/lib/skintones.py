@@ -0,0 +1,68 @@
+from typing import Optional
+
+# Skintone variants, indexed once from the emoji database.
+#
+# Every variant is stored under its base emoji and the modifiers of each
+# person it shows, so "waving hand, medium skin tone" is (1F44B, (1F3FD,)) and
+# "women holding hands, light and dark skin tones" is (1F46D, (1F3FB, 1F3FF)).
+# A variant with the same skintone for everyone is stored with a single modifier:
+# that's the one shown when a default skintone is set.
+
+SKINTONE_MODIFIERS = ('1F3FB', '1F3FC', '1F3FD', '1F3FE', '1F3FF')
+
+class SkintoneTable():
+    def __init__(self, emojis: dict):
+        self.variants: dict[tuple[str, tuple[str, ...]], dict] = {}
+        self.variants_by_base: dict[str, list[dict]] = {}
+        # {variant hexcode: base hexcode}
+        self.bases: dict[str, str] = {}
+
+        for hexcode in emojis:
+            tones = emojis[hexcode].get('skintones')
+
+            if not tones:
+                continue
+
+            self.variants_by_base[hexcode] = tones
+
+            for tone in tones:
+                self.bases[tone['hexcode']] = hexcode
+
+                if tone.get('skintone'):
+                    modifiers = tuple(SKINTONE_MODIFIERS[int(i) - 1] for i in str(tone['skintone']).split(','))
+                    self.variants[(hexcode, modifiers)] = tone
+
+    def get_variant(self, hexcode: str, *modifiers: str) -> Optional[dict]:
+        """Returns the variant of an emoji with these modifiers, one per person or a single one for everyone"""
+        return self.variants.get((hexcode, modifiers))
+
+    def get_variants(self, hexcode: str) -> list[dict]:
+        return self.variants_by_base.get(hexcode, [])
+
+    def has_variants(self, hexcode: str) -> bool:
+        return hexcode in self.variants_by_base
+
+    def get_base(self, hexcode: str) -> Optional[str]:
+        """Returns the hexcode of the emoji a variant belongs to"""
+        return self.bases.get(hexcode)
+
+    def get_variant_by_hexcode(self, hexcode: str) -> Optional[dict]:
+        base = self.bases.get(hexcode)
+
+        if not base:
+            return None
+
+        return next(t for t in self.variants_by_base[base] if t['hexcode'] == hexcode)
+
+
+_skintone_table: Optional[SkintoneTable] = None
+
+def get_skintone_table() -> SkintoneTable:
+    """Returns the shared skintone table, building it on the first call"""
+    global _skintone_table
+
+    if _skintone_table is None:
+        from ..assets.emoji_list import emojis
+        _skintone_table = SkintoneTable(emojis)
+
+    return _skintone_table
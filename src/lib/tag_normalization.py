@@ -0,0 +1,23 @@
+# Tag normalization shared by the search index and the generators in precompile/,
+# which write tags that are already normalized.
+#
+# Changing these functions means the locale packs need to be regenerated
+# (and localized_tags.VERSION bumped).
+
+import unicodedata
+
+# letters that are not decomposed by NFKD, but that people type without the stroke or as two letters
+_foldings = str.maketrans({'œ': 'oe', 'æ': 'ae', 'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'þ': 'th', 'ı': 'i'})
+
+def normalize_tag(tag: str) -> str:
+    """Compatibility decomposition, without accents and casefolded: "Café" and "cafe" are the same tag"""
+    decomposed = unicodedata.normalize('NFKD', tag.strip())
+
+    if decomposed.isascii():
+        return decomposed.lower()
+
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().translate(_foldings)
+
+def split_tags(tags: str) -> list[str]:
+    """Splits a comma separated list of tags, as stored in the emoji list and in the custom tags"""
+    return [t for t in (normalize_tag(t) for t in tags.split(',')) if t]
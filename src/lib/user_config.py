@@ -1,35 +1,241 @@
+import os
 import json
-from gi.repository import GLib
+import threading
+from typing import Optional
+from gi.repository import GLib, Gio
 
-# These two helper functions can be used to 
+# These helper functions can be used to
 # read and write a json file in the user's configuration directory
 #
 # If the file does not exits, it will be created
+#
+# Parsed documents are kept in memory: a read only parses the file again when
+# its modification time or size changed, so reading on a hot path is free.
+# save_json_config() updates the cached document immediately and writes the
+# file WRITE_DELAY ms later, so a burst of changes is written only once.
+# Files are replaced atomically (temporary file, fsync, rename): a crash
+# leaves either the old or the new content, never a truncated file.
+# Documents are serialized on the main thread and written by a worker thread,
+# saving never waits for the disk.
+#
+# Documents with listeners (see connect_json_config_changed) are watched with a
+# Gio.FileMonitor: when another process (the settings of a second instance, an
+# editor...) changes them, they are parsed again in a worker thread and the
+# listeners are called on the main thread, reads never have to check the file.
 
-def save_json_config(content: dict or List, filename: str):
-    """Saves in a configuration file"""
-    with open(f"{GLib.get_user_config_dir()}/{filename}.json", 'w+') as f:
-        f.write(json.dumps(content))
+WRITE_DELAY = 500
+RELOAD_DELAY = 100
 
-def read_json_config(filename: str) -> dict or list or False:
-    """Reads from a configuration file"""
-    config_dir = GLib.get_user_config_dir()
-    config_filename = f"{config_dir}/{filename}.json"
+# {filename: (stat signature, document)}, the signature is None while a write is pending or if there is no file
+_documents: dict[str, tuple[Optional[tuple], object]] = {}
+_pending_writes: dict[str, int] = {}
+_documents_lock = threading.Lock()
+
+# {filename: generation} of the snapshots handed to a worker, only the latest one is written
+_write_generations: dict[str, int] = {}
+_writes_in_flight: set[str] = set()
+_write_threads: list[threading.Thread] = []
+_write_lock = threading.Lock()
+
+# {filename: stat signature} of the last write from this process, to ignore our own changes
+_written_signatures: dict[str, Optional[tuple]] = {}
+
+# {filename: (Gio.FileMonitor, listeners)}
+_watchers: dict[str, tuple[Gio.FileMonitor, list[callable]]] = {}
+_pending_reloads: dict[str, int] = {}
+
+def get_config_path(filename: str) -> str:
+    return f"{GLib.get_user_config_dir()}/{filename}.json"
+
+def _stat_signature(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _write_file(path: str, content: bytes):
+    if hasattr(GLib, 'file_set_contents_full'):
+        GLib.file_set_contents_full(path, content, GLib.FileSetContentsFlags.CONSISTENT | GLib.FileSetContentsFlags.DURABLE, 0o666)
+    else:
+        # GLib < 2.66 replaces the file atomically too, it just may not fsync it
+        GLib.file_set_contents(path, content)
+
+def save_json_config(content: dict or list, filename: str):
+    """Saves in a configuration file
+
+    The file is written a moment later, together with any other change to the same document;
+    call flush_json_configs() to write it right away.
+    """
+    with _documents_lock:
+        _documents[filename] = (None, content)
+
+        if not filename in _pending_writes:
+            _pending_writes[filename] = GLib.timeout_add(WRITE_DELAY, _on_write_timeout, filename)
+
+def _on_write_timeout(filename: str):
+    _flush_json_config(filename)
+
+    # the threads of the writes that are done
+    _write_threads[:] = [t for t in _write_threads if t.is_alive()]
+    return False
+
+def _flush_json_config(filename: str, blocking=False):
+    with _documents_lock:
+        source_id = _pending_writes.pop(filename, None)
+
+        if source_id is None:
+            return
+
+        content = json.dumps(_documents[filename][1]).encode('utf-8')
+        generation = _write_generations.get(filename, 0) + 1
+
+        _write_generations[filename] = generation
+        _writes_in_flight.add(filename)
+
+    if blocking:
+        _write_json_config(filename, content, generation)
+    else:
+        thread = threading.Thread(target=_write_json_config, args=(filename, content, generation), daemon=True)
+        _write_threads.append(thread)
+        thread.start()
+
+def _write_json_config(filename: str, content: bytes, generation: int):
+    with _write_lock:
+        with _documents_lock:
+            # a newer snapshot is about to be written
+            if generation != _write_generations[filename]:
+                return
+
+        path = get_config_path(filename)
+        _write_file(path, content)
+        signature = _stat_signature(path)
+
+        with _documents_lock:
+            _written_signatures[filename] = signature
+
+            if generation == _write_generations[filename]:
+                _writes_in_flight.discard(filename)
+
+                # unless it was saved again in the meantime, the cached document is what the file holds
+                if not filename in _pending_writes:
+                    _documents[filename] = (signature, _documents[filename][1])
+
+def flush_json_configs():
+    """Writes the documents that are waiting to be saved and waits for the writes in progress, e.g. before quitting"""
+    for filename in list(_pending_writes):
+        GLib.source_remove(_pending_writes[filename])
+        _flush_json_config(filename, blocking=True)
+
+    while _write_threads:
+        _write_threads.pop().join()
+
+def save_json_config_raw(content: str, filename: str):
+    """Saves an already serialized document in a configuration file, immediately
 
+    Safe to call from a worker thread; the cached document, if any, is dropped.
+    """
+    path = get_config_path(filename)
+    _write_file(path, content.encode('utf-8'))
+
+    with _documents_lock:
+        _written_signatures[filename] = _stat_signature(path)
+
+        if not filename in _pending_writes:
+            _documents.pop(filename, None)
+
+def _parse_json_config(filename: str) -> tuple[Optional[tuple], dict or list or False]:
+    """Returns the stat signature of a configuration file and its content, False if it can't be read"""
+    config_filename = get_config_path(filename)
+    signature = _stat_signature(config_filename)
     current_conf_raw = False
 
     try:
         current_conf_raw = GLib.file_get_contents(config_filename)
     except GLib.Error as e:
         if e.code != GLib.FileError.NOENT:
-            return False
+            return signature, False
 
     current_conf_json = current_conf_raw.contents.decode() if current_conf_raw else '{}'
 
     try:
-        current_conf = json.loads(current_conf_json)
+        return signature, json.loads(current_conf_json)
     except:
         print('Config file is not readable')
+        return signature, False
+
+def read_json_config(filename: str) -> dict or list or False:
+    """Reads from a configuration file
+
+    The document is shared with the other callers: after changing it, save it with save_json_config().
+    Returns False if the file exists but can't be read.
+    """
+    with _documents_lock:
+        if filename in _documents:
+            signature, document = _documents[filename]
+
+            # a pending write is newer than the file, watched files are reloaded when they change
+            if (filename in _pending_writes) or (filename in _writes_in_flight) or (filename in _watchers) or (signature == _stat_signature(get_config_path(filename))):
+                return document
+
+    signature, current_conf = _parse_json_config(filename)
+
+    if current_conf is False:
+        return False
+
+    with _documents_lock:
+        # a document saved while the file was being read wins
+        if not ((filename in _pending_writes) or (filename in _writes_in_flight)):
+            _documents[filename] = (signature, current_conf)
+
+    return current_conf
+
+def connect_json_config_changed(filename: str, callback: callable):
+    """Calls callback(previous, document) on the main thread when another process changes a configuration file
+
+    previous is None if the document was never read. The file is watched from the first call.
+    """
+    if not filename in _watchers:
+        monitor = Gio.File.new_for_path(get_config_path(filename)).monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        monitor.connect('changed', _on_config_file_changed, filename)
+
+        _watchers[filename] = (monitor, [])
+
+    _watchers[filename][1].append(callback)
+
+def _on_config_file_changed(monitor: Gio.FileMonitor, file: Gio.File, other_file: Optional[Gio.File], event_type: Gio.FileMonitorEvent, filename: str):
+    # an atomic write is a burst of events (created, renamed, changes done...), the file is read once
+    if filename in _pending_reloads:
+        GLib.source_remove(_pending_reloads[filename])
+
+    _pending_reloads[filename] = GLib.timeout_add(RELOAD_DELAY, _on_reload_timeout, filename)
+
+def _on_reload_timeout(filename: str):
+    del _pending_reloads[filename]
+
+    with _documents_lock:
+        own_write = (_written_signatures.get(filename, False) == _stat_signature(get_config_path(filename)))
+
+    if not own_write:
+        threading.Thread(target=lambda: GLib.idle_add(_apply_reloaded_json_config, filename, *_parse_json_config(filename)), daemon=True).start()
+
+    return False
+
+def _apply_reloaded_json_config(filename: str, signature: Optional[tuple], document: dict or list or False):
+    if document is False:
         return False
 
-    return current_conf
\ No newline at end of file
+    with _documents_lock:
+        # a local change is about to overwrite the file anyway
+        if (filename in _pending_writes) or (filename in _writes_in_flight):
+            return False
+
+        previous = _documents[filename][1] if filename in _documents else None
+        _documents[filename] = (signature, document)
+
+    if previous != document:
+        for callback in _watchers[filename][1]:
+            callback(previous, document)
+
+    return False
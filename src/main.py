@@ -1,19 +1,28 @@
-import manimpango
+from time import perf_counter
+from .lib import profiler
+
+_import_start = perf_counter()
+
 import sys
 import gi
 
-from .utils import make_option, portal
+# The preferences, the shortcuts, the update dialog and dbus-python are imported
+# when they are first used, only what paints the picker is loaded at startup;
+# benchmarks/import_time.py checks that it stays this way.
+from .utils import make_option
 from .Picker import Picker
-from .ShortcutsWindow import ShortcutsWindow
-from .Settings import Settings
-from .components.UpdateDialog import UpdateDialog
 from .lib.DbusService import DbusService, GNOME_EXTENSION_LINK
+from .lib.emoji_history import get_history_store
+from .lib.user_config import flush_json_configs
+from .lib.app_settings import get_app_settings
 
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 
 from gi.repository import Gtk, Gio, Gdk, Adw, GLib  # noqa
 
+profiler.add_span('module import', _import_start, perf_counter())
+
 
 class Smile(Adw.Application):
     def __init__(self, **kwargs) -> None:
@@ -22,7 +31,9 @@ class Smile(Adw.Application):
 
         entries = [
             make_option('start-hidden'),
-            make_option('version')
+            make_option('version'),
+            make_option('debug', description='Print the time from activation to the first frame'),
+            make_option('profile', arg=GLib.OptionArg.FILENAME, description='Write a trace of the startup phases, in the Chrome trace format', arg_description='FILE'),
         ]
 
         self.add_main_option_entries(entries)
@@ -32,7 +43,10 @@ class Smile(Adw.Application):
         self.last_about_key_pressed = None
         self.about = None
         self.start_hidden = False
+        self.debug = False
         self.window = None
+        self.dbus_service = None
+        self.process_start_reported = False
 
     def do_handle_local_options(self, options):
         if options.contains('version'):
@@ -40,51 +54,122 @@ class Smile(Adw.Application):
             return 0
 
         self.start_hidden = options.contains('start-hidden')
+        self.debug = options.contains('debug')
+
+        if options.contains('profile'):
+            profiler.set_output_path(options.lookup_value('profile').get_bytestring().decode('utf-8'))
+
+        profiler.end_option_parsing()
+
         return -1
 
     def do_startup(self):
         Adw.Application.do_startup(self)
 
-        manimpango.register_font(self.datadir + '/assets/NotoColorEmoji.ttf')
-        css_provider = Gtk.CssProvider()
-        css_provider.load_from_resource('/it/mijorus/smile/assets/style.css')
-        Gtk.StyleContext.add_provider_for_display(Gdk.Display.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
-        self.settings = Gio.Settings.new(self.application_id)
+        with profiler.span('manimpango.register_font'):
+            import manimpango
+            manimpango.register_font(self.datadir + '/assets/NotoColorEmoji.ttf')
+
+        with profiler.span('CSS load'):
+            css_provider = Gtk.CssProvider()
+            css_provider.load_from_resource('/it/mijorus/smile/assets/style.css')
+            Gtk.StyleContext.add_provider_for_display(Gdk.Display.get_default(), css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+
+        self.settings = get_app_settings()
+
+        # only the primary instance runs this, the bus name is acquired asynchronously
+        self.dbus_service = DbusService()
+        self.dbus_service.connect()
+
+    def do_shutdown(self):
+        get_history_store().flush()
+        flush_json_configs()
+        profiler.save()
+        Adw.Application.do_shutdown(self)
+
+    def runs_in_background(self) -> bool:
+        """When True, the picker is hidden instead of closed and stays ready for the next activation"""
+        return self.start_hidden or self.settings.get_boolean('load-hidden-on-startup')
 
     def do_activate(self):
+        activation_start = perf_counter()
+
         # We only allow a single window and raise any existing ones
         if not self.window:
             # Windows are associated with the application
             # when the last one is closed the application shuts down
-            self.window = Picker(application=self)
+            with profiler.span('Picker.__init__'):
+                self.window = Picker(application=self)
 
             self.create_action("preferences", lambda w, e: self.on_preferences_action())
-            self.create_action("open_shortcuts", lambda w, e: ShortcutsWindow().open())
+            self.create_action("open_shortcuts", lambda w, e: self.on_shortcuts_action())
             self.create_action("open_changelog", lambda w, e: Gtk.UriLauncher.new('https://smile.mijorus.it/changelog').launch())
             self.create_action("translate", lambda w, e: Gtk.UriLauncher.new('https://github.com/mijorus/smile/tree/master/po').launch())
             self.create_action("gnome_extension", lambda w, e: Gtk.UriLauncher.new(GNOME_EXTENSION_LINK).launch())
 
             self.create_action("about", self.on_about_action)
 
-            if not self.start_hidden:
+            if self.start_hidden:
+                # background service: do the expensive work now, so that the next activation only needs to show the window
+                self.window.prepare_in_background()
+                self.window.prebuild_typo_index()
+                self.dbus_service.detect_extension()
+            else:
                 self.window.show()
                 self.window.on_activation()
+                self.report_first_frame(activation_start)
 
-                last_run_version = self.settings.get_string('last-run-version').replace('.', '')
-                last_run_version = int(last_run_version if len(last_run_version) else '-1')
+                # the extension and the typo index are only needed later, nothing waits for them before the first frame
+                self.window.connect_first_frame(lambda t: self.dbus_service.detect_extension())
+                self.window.connect_first_frame(lambda t: self.window.prebuild_typo_index())
 
-                UpdateDialog.show(self.window, last_run_version, self.version)
+                if self.settings.get_string('last-run-version') != self.version:
+                    from .components.UpdateDialog import UpdateDialog
 
-                self.settings.set_string('last-run-version', self.version)
+                    last_run_version = self.settings.get_string('last-run-version').replace('.', '')
+                    last_run_version = int(last_run_version if len(last_run_version) else '-1')
+
+                    UpdateDialog.show(self.window, last_run_version, self.version)
+
+                    self.settings.set_string('last-run-version', self.version)
 
         else:
             self.window.set_visible(True)
             self.window.on_activation()
+            self.report_first_frame(activation_start)
+
+    def report_first_frame(self, activation_start: float):
+        if not (self.debug or profiler.is_enabled()):
+            return
+
+        def on_first_frame(end: float):
+            profiler.add_span('first frame', activation_start, end)
+
+            # the cold start, from the exec of the process
+            if (not self.process_start_reported) and profiler.process_start:
+                self.process_start_reported = True
+                profiler.add_span('exec to first frame', profiler.process_start, end)
+
+                if self.debug:
+                    print(f'Time from exec to first frame: {(end - profiler.process_start) * 1000:.1f}ms')
+
+            profiler.save()
+
+            if self.debug:
+                print(f'Time to first frame: {(end - activation_start) * 1000:.1f}ms')
+
+        self.window.connect_first_frame(on_first_frame)
 
     def on_preferences_action(self):
+        from .Settings import Settings
+
         pref_window = Settings(self.application_id, transient_for=self.window)
         pref_window.present()
 
+    def on_shortcuts_action(self):
+        from .ShortcutsWindow import ShortcutsWindow
+        ShortcutsWindow().open()
+
     def create_action(self, name, callback):
         """ Add an Action and connect to a callback """
         action = Gio.SimpleAction.new(name, None)
@@ -123,7 +208,4 @@ class Smile(Adw.Application):
 def main(version: str, datadir: str) -> None:
     app = Smile(version=version, datadir=datadir)
 
-    dbus_service = DbusService()
-    dbus_service.connect()
-
     app.run(sys.argv)
@@ -1,25 +1,6 @@
-import dbus
-from threading import Timer
+from time import perf_counter
 from gi.repository import GLib, Gio
 
-_tags_cache = {}
-def tag_list_contains(tags: str, q: str) -> bool:
-    global _tags_cache
-
-    q = q.lower()
-
-    if tags in _tags_cache:
-        tags_arr = _tags_cache[tags]
-    else:
-        tags_arr = tags.replace(', ', ',').split(',')
-        _tags_cache[tags] = tags_arr
-
-    for t in tags_arr:
-        if t.lower().startswith(q):
-            return True
-    
-    return False
-
 # thank you mate ❤️
 # https://github.com/gtimelog/gtimelog/blob/6e4b07b58c730777dbdb00b3b85291139f8b10aa/src/gtimelog/main.py#L159
 def make_option(long_name, short_name=None, flags=0, arg=GLib.OptionArg.NONE, arg_data=None, description=None, arg_description=None):
@@ -42,32 +23,110 @@ def read_text_resource(res: str) -> str:
     file.unref()
     return decoded
 
-def portal(interface: str, bus_name: str='org.freedesktop.portal.Desktop', object_path: str='/org/freedesktop/portal/desktop') -> dbus.Interface:
+def portal(interface: str, bus_name: str='org.freedesktop.portal.Desktop', object_path: str='/org/freedesktop/portal/desktop') -> 'dbus.Interface':
+    # dbus-python is only needed by the preferences, it's not loaded at startup
+    import dbus
+
     bus = dbus.SessionBus()
     obj = bus.get_object(bus_name, object_path)
     inter = dbus.Interface(obj, interface)
 
     return inter
 
-def debounce(wait):
+class Debouncer():
+    """ Runs a callback in the main loop after wait seconds have elapsed
+        since the last time it was scheduled, without spawning threads.
+
+        leading: run immediately when nothing is pending, then wait
+        trailing: run once more at the end of the wait, with the latest arguments
+        adaptive: stretch the wait up to max_wait when the callback is slow,
+            measured as a moving average of its duration
+        measure_cost: time the callback; turn it off when the slow part runs elsewhere,
+            e.g. in a worker thread, and report its duration with record_cost() """
+
+    def __init__(self, callback: callable, wait: float, leading=False, trailing=True, adaptive=False, max_wait: float = None, measure_cost=True):
+        self.callback = callback
+        self.wait = wait
+        self.leading = leading
+        self.trailing = trailing
+        self.adaptive = adaptive
+        self.max_wait = max_wait if max_wait is not None else wait
+        self.measure_cost = measure_cost
+
+        self.average_cost = 0.0
+        self._source_id = None
+        self._pending = None
+
+    def __call__(self, *args, **kwargs):
+        if self._source_id is None and self.leading:
+            self._run(args, kwargs)
+        else:
+            self._pending = (args, kwargs)
+
+        self.reschedule()
+
+    def get_delay(self) -> float:
+        if not self.adaptive:
+            return self.wait
+
+        return min(self.max_wait, max(self.wait, self.average_cost * 2))
+
+    def reschedule(self, wait: float = None):
+        """(Re)starts the timer; call it to push back a pending run"""
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+
+        delay = wait if wait is not None else self.get_delay()
+        self._source_id = GLib.timeout_add(round(delay * 1000), self._on_timeout)
+
+    def cancel(self):
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+
+        self._source_id = None
+        self._pending = None
+
+    def flush(self):
+        """Runs the pending call right away"""
+        pending = self._pending
+        self.cancel()
+
+        if pending:
+            self._run(*pending)
+
+    def _on_timeout(self):
+        self._source_id = None
+        pending = self._pending
+        self._pending = None
+
+        if pending and self.trailing:
+            self._run(*pending)
+
+        return GLib.SOURCE_REMOVE
+
+    def record_cost(self, seconds: float):
+        # exponential moving average, recent searches count more
+        self.average_cost = (self.average_cost * 0.7) + (seconds * 0.3)
+
+    def _run(self, args, kwargs):
+        start = perf_counter()
+        self.callback(*args, **kwargs)
+
+        if self.measure_cost:
+            self.record_cost(perf_counter() - start)
+
+def debounce(wait, leading=False, trailing=True, adaptive=False, max_wait=None, measure_cost=True):
     """ Decorator that will postpone a functions
         execution until after wait seconds
-        have elapsed since the last time it was invoked. """
+        have elapsed since the last time it was invoked.
+
+        It runs in the main loop, see Debouncer """
     def decorator(fn):
+        debouncer = Debouncer(fn, wait, leading=leading, trailing=trailing, adaptive=adaptive, max_wait=max_wait, measure_cost=measure_cost)
+
         def debounced(*args, **kwargs):
-            def call_it():
-                fn(*args, **kwargs)
-            try:
-                debounced.t.cancel()
-            except(AttributeError):
-                pass
-            debounced.t = Timer(wait, call_it)
-            debounced.t.start()
-        return debounced
-    return decorator
+            debouncer(*args, **kwargs)
 
-# Used as a decorator to run things in the main loop, from another thread
-def idle(func):
-    def wrapper(*args, **kwargs):
-        GLib.idle_add(func, *args)
-    return wrapper
\ No newline at end of file
+        debounced.debouncer = debouncer
+        return debounced
+    return decorator
\ No newline at end of file